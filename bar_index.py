@@ -0,0 +1,90 @@
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+
+
+NO_BAR = -1
+DAY_NS = 24 * 60 * 60 * 10 ** 9
+BAR_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+
+Bar = namedtuple("Bar", ["open", "high", "low", "close", "volume"])
+
+
+# timestamp as nanoseconds of exchange local time
+def to_timestamp(date):
+    date = pd.Timestamp(date)
+    if date.tz is not None:
+        date = date.tz_convert("America/New_York").tz_localize(None)
+    return date.value
+
+def to_timestamps(dates):
+    dates = pd.DatetimeIndex(dates)
+    if dates.tz is not None:
+        dates = dates.tz_convert("America/New_York").tz_localize(None)
+    return dates.values.astype("datetime64[ns]").astype(np.int64)
+
+
+# bars of a (ticker, interval) series stored as sorted numpy arrays
+# "as of" lookups find the last bar at or before a time with a binary search
+class BarIndex:
+    # dates: sorted int64 timestamps, columns: column name -> array of values
+    # arrays are not copied so they can be memory mapped
+    def __init__(self, dates, columns):
+        self.__dates = dates
+        self.__columns = {}
+        for column in BAR_COLUMNS:
+            if column in columns:
+                self.__columns[column] = columns[column]
+            else:
+                self.__columns[column] = np.full(len(self.__dates), np.nan)
+
+    @staticmethod
+    def from_frame(data):
+        columns = {column: data[column].to_numpy(dtype=np.float64) for column in BAR_COLUMNS if column in data.columns}
+        return BarIndex(to_timestamps(data.index), columns)
+
+    def __len__(self):
+        return len(self.__dates)
+
+    def get_dates(self):
+        return self.__dates
+
+    def get_column(self, column):
+        return self.__columns[column]
+
+    def get_value(self, column, position):
+        return self.__columns[column][position]
+
+    def get_bar(self, position):
+        return Bar(*[self.__columns[column][position] for column in BAR_COLUMNS])
+
+    # (len(positions), 5) array of Open, High, Low, Close, Volume, nan rows where position is NO_BAR
+    def get_bars(self, positions):
+        positions = np.asarray(positions)
+        bars = np.full((len(positions), len(BAR_COLUMNS)), np.nan)
+        found = positions != NO_BAR
+        for i, column in enumerate(BAR_COLUMNS):
+            bars[found, i] = self.__columns[column][positions[found]]
+        return bars
+
+    # position of the last bar at or before date, NO_BAR if there is no such bar
+    def asof(self, date):
+        return int(np.searchsorted(self.__dates, to_timestamp(date), side="right")) - 1
+
+    # positions of the last bars at or before every date, NO_BAR where there is no such bar
+    def asof_many(self, dates):
+        return np.searchsorted(self.__dates, to_timestamps(dates), side="right") - 1
+
+    # values of the column as of every date, nan where there is no bar
+    def get_values_asof(self, column, dates):
+        positions = self.asof_many(dates)
+        values = np.full(len(positions), np.nan)
+        found = positions != NO_BAR
+        values[found] = self.__columns[column][positions[found]]
+        return values
+
+    # positions range [first, last) of bars in [start_date, end_date]
+    def get_range(self, start_date, end_date):
+        first = int(np.searchsorted(self.__dates, to_timestamp(start_date), side="left"))
+        last = int(np.searchsorted(self.__dates, to_timestamp(end_date), side="right"))
+        return first, max(first, last)
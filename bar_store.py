@@ -0,0 +1,92 @@
+import os
+import time
+import tempfile
+import numpy as np
+import pandas as pd
+
+
+class BarStoreError(Exception):
+    pass
+
+
+# persistent on-disk storage of downloaded bars
+# every (ticker, interval) series is kept in its own file <root>/<interval>/<ticker>.npz
+# the file is columnar: timestamps and every column are stored as separate numpy arrays
+class BarStore:
+    def __init__(self, root, refresh_interval=12 * 60 * 60):
+        self.__root = root
+        self.__refresh_interval = refresh_interval  # seconds after which stored data is refreshed
+
+    def get_root(self):
+        return self.__root
+
+    def get_path(self, ticker, interval):
+        return os.path.join(self.__root, interval, ticker + ".npz")
+
+    def has(self, ticker, interval):
+        return os.path.exists(self.get_path(ticker, interval))
+
+    # stored data is fresh if it was written less than refresh_interval seconds ago
+    def is_fresh(self, ticker, interval):
+        path = self.get_path(ticker, interval)
+        if not os.path.exists(path):
+            return False
+        return time.time() - os.path.getmtime(path) < self.__refresh_interval
+
+    # the timestamp of the last stored bar or None if nothing is stored
+    def get_last_date(self, ticker, interval):
+        data = self.load(ticker, interval)
+        if data is None or data.empty:
+            return None
+        return data.index[-1]
+
+    # returns None if there is no data for (ticker, interval)
+    def load(self, ticker, interval):
+        path = self.get_path(ticker, interval)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as npz:
+                columns = [str(column) for column in npz["columns"]]
+                index = pd.DatetimeIndex(npz["index"].astype("datetime64[ns]"), name=str(npz["index_name"]))
+                data = {column: npz["column_" + str(i)] for i, column in enumerate(columns)}
+        except (OSError, KeyError, ValueError) as e:
+            raise BarStoreError(f"corrupted bar file {path}") from e
+        return pd.DataFrame(data, index=index, columns=columns)
+
+    def save(self, ticker, interval, data):
+        path = self.get_path(ticker, interval)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+
+        arrays = {
+            "index": data.index.values.astype("datetime64[ns]").astype(np.int64),
+            "index_name": np.array(data.index.name or "Date"),
+            "columns": np.array([str(column) for column in data.columns]),
+        }
+        for i, column in enumerate(data.columns):
+            arrays["column_" + str(i)] = data[column].to_numpy()
+
+        # write to a temporary file first so that concurrent readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                np.savez(file, **arrays)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    # merges new bars into the stored ones, new bars override stored bars with the same timestamp
+    def append(self, ticker, interval, new_data):
+        data = self.load(ticker, interval)
+        if data is None or data.empty:
+            data = new_data
+        elif new_data is not None and not new_data.empty:
+            data = pd.concat([data, new_data])
+            data = data[~data.index.duplicated(keep="last")].sort_index()
+        if data is None:
+            return None
+        self.save(ticker, interval, data)
+        return data
@@ -0,0 +1,207 @@
+import io
+import os
+import sys
+import json
+import time
+import platform
+import tempfile
+import argparse
+import subprocess
+import importlib.util
+from datetime import datetime, timedelta
+import market
+from market import Market, get_data, get_bar_index
+from providers import SyntheticProvider
+from stock import Stock
+from trading_calendar import get_default_calendar
+
+
+# reproducible benchmarks of the simulator hot paths on offline synthetic data
+# results are written as JSON so runs of different commits can be compared:
+#   python3 benchmark.py -o bench_output.txt
+#   python3 benchmark.py -o new.txt --compare bench_output.txt
+
+START_DATE = datetime(2020, 3, 2)
+UNIVERSES = (4, 16, 64)        # number of tickers
+RUN_DAYS = (30, 90, 250)       # calendar days of a run
+QUICK_UNIVERSES = (4, 16)
+QUICK_RUN_DAYS = (30, 90)
+
+
+def _load_example(file_name, module_name):
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), file_name)
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def get_tickers(n):
+    return [f"T{i:03d}" for i in range(n)]
+
+def get_provider(run_days):
+    return SyntheticProvider(seed=1, start=START_DATE - timedelta(days=60), end=START_DATE + timedelta(days=run_days + 30))
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+# best of repeat timings of function()
+def _measure(function, repeat):
+    best = None
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        function()
+        seconds = time.perf_counter() - begin
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+def _result(name, parameters, seconds, count, unit):
+    return {"name": name, "parameters": parameters, "seconds": seconds, "count": count,
+            "rate": count / seconds if seconds > 0 else None, "unit": unit}
+
+def _load_series(tickers, provider, intervals=("1d", "1h", "30m")):
+    for ticker in tickers:
+        for interval in intervals:
+            get_data(ticker, interval, provider)
+            get_bar_index(ticker, interval, provider)
+
+
+# ticks per second of AccountSimulator.run of the example strategies, data is loaded before timing
+def bench_run(universes, run_days, repeat):
+    examples = [("80-20s", _load_example("example_80-20s.py", "example_80_20s").Algorithm8020),
+                ("momentum-pinball", _load_example("example_momentum-pinball.py", "example_momentum_pinball").AlgorithmMomentumPinball)]
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bench_") as directory:
+        for days in run_days:
+            provider = get_provider(days)
+            end_date = START_DATE + timedelta(days=days)
+            ticks = len(get_default_calendar().get_ticks(START_DATE, end_date))
+            for n in universes:
+                tickers = get_tickers(n)
+                _load_series(tickers, provider)
+                for name, strategy_class in examples:
+                    journal = os.path.join(directory, f"{name}.jsonl")
+                    def run():
+                        simulator = strategy_class(100 * n, 0.00025, tickers, journal, provider)
+                        simulator.run(START_DATE, end_date)
+                    seconds = _measure(run, repeat)
+                    results.append(_result(f"run {name}", {"tickers": n, "days": days}, seconds, ticks, "ticks"))
+    return results
+
+
+# latency of Market.get_price at random hours and of Market.get_data date slicing
+def bench_market(universes, run_days, repeat, calls=2000):
+    results = []
+    for days in run_days:
+        provider = get_provider(days)
+        end_date = START_DATE + timedelta(days=days)
+        dates = get_default_calendar().get_ticks(START_DATE, end_date)[:-1]
+        for n in universes:
+            tickers = get_tickers(n)
+            _load_series(tickers, provider)
+            current = Market(end_date, provider)
+            queries = [(tickers[i % n], dates[(i * 7919) % len(dates)]) for i in range(calls)]
+
+            seconds = _measure(lambda: [current.get_price(ticker, date) for ticker, date in queries], repeat)
+            results.append(_result("Market.get_price", {"tickers": n, "days": days}, seconds, calls, "calls"))
+
+            slices = [(tickers[i % n], dates[(i * 7919) % len(dates)]) for i in range(calls // 10)]
+            seconds = _measure(lambda: [current.get_data(ticker, date - timedelta(days=10), date, "1h")
+                                        for ticker, date in slices], repeat)
+            results.append(_result("Market.get_data", {"tickers": n, "days": days}, seconds, len(slices), "calls"))
+    return results
+
+
+# Stock.buy / Stock.sell throughput with many lots and large share counts
+def bench_stock(repeat, operations=(10000, 100000), shares=1000000):
+    results = []
+    for n in operations:
+        def trade():
+            stock = Stock("T000")
+            for i in range(n):
+                stock.buy(100 + i % 7, shares)
+            for i in range(n):
+                stock.sell(shares, 101 + i % 5)
+        seconds = _measure(trade, repeat)
+        results.append(_result("Stock.buy/sell", {"operations": n, "shares": shares}, seconds, 2 * n, "operations"))
+    return results
+
+
+# printing and plotting of a finished run
+def bench_reports(universes, run_days, repeat):
+    strategy_class = _load_example("example_80-20s.py", "example_80_20s").Algorithm8020
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bench_") as directory:
+        for days in run_days:
+            provider = get_provider(days)
+            end_date = START_DATE + timedelta(days=days)
+            for n in universes:
+                tickers = get_tickers(n)
+                simulator = strategy_class(100 * n, 0.00025, tickers, os.path.join(directory, "run.jsonl"), provider)
+                simulator.run(START_DATE, end_date)
+                operations = len(simulator.get_ledger())
+
+                seconds = _measure(lambda: simulator.print_operations_history(io.StringIO()), repeat)
+                results.append(_result("print_operations_history", {"tickers": n, "days": days}, seconds, operations, "operations"))
+
+                plots = os.path.join(directory, "plots")
+                seconds = _measure(lambda: simulator.history_plot(directory=plots, processes=1), repeat)
+                results.append(_result("history_plot", {"tickers": n, "days": days}, seconds,
+                                       len(simulator.get_ledger().get_tickers()), "plots"))
+    return results
+
+
+def run_benchmarks(quick=False, repeat=3):
+    universes = QUICK_UNIVERSES if quick else UNIVERSES
+    run_days = QUICK_RUN_DAYS if quick else RUN_DAYS
+    market.set_offline(True)   # synthetic data only, nothing is downloaded
+    results = []
+    results += bench_run(universes, run_days, repeat)
+    results += bench_market(universes, run_days, repeat)
+    results += bench_stock(repeat)
+    results += bench_reports(universes, run_days, repeat)
+    return {"commit": _git_commit(), "date": datetime.now().isoformat(), "python": platform.python_version(),
+            "machine": platform.machine(), "quick": quick, "repeat": repeat, "results": results}
+
+
+def _key(result):
+    return result["name"], json.dumps(result["parameters"], sort_keys=True)
+
+# ratios of the new seconds to the old ones, > 1 means slower
+def compare(old, new):
+    old_results = {_key(result): result for result in old["results"]}
+    ratios = []
+    for result in new["results"]:
+        previous = old_results.get(_key(result))
+        if previous is not None and previous["seconds"] > 0:
+            ratios.append((result["name"], result["parameters"], result["seconds"] / previous["seconds"]))
+    return ratios
+
+
+def print_results(report, file=sys.stdout):
+    for result in report["results"]:
+        file.write(f"{result['name']:26} {json.dumps(result['parameters']):42} "
+                   f"{result['seconds']:10.4f} s {result['rate']:14.1f} {result['unit']}/s\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="simulator benchmarks on synthetic data")
+    parser.add_argument("-o", "--output", default="bench_output.txt", help="JSON results file")
+    parser.add_argument("--quick", action="store_true", help="smaller universes and shorter runs")
+    parser.add_argument("--repeat", type=int, default=3, help="best of this number of timings")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.quick, args.repeat)
+    print_results(report)
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=1)
+
+    if args.compare:
+        with open(args.compare) as file:
+            for name, parameters, ratio in compare(json.load(file), report):
+                print(f"{name:26} {json.dumps(parameters):42} x{ratio:.2f}")
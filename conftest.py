@@ -0,0 +1,32 @@
+import sys
+import os
+import importlib.util
+import pytest
+import market
+
+
+# offline mode for the test, the previous mode is restored after it
+@pytest.fixture
+def offline():
+    previous = market.is_offline()
+    market.set_offline(True)
+    yield
+    market.set_offline(previous)
+
+
+# example files have dashes in their names, they are loaded as modules so their strategies can be pickled
+def load_example(file_name, name):
+    if not name in sys.modules:
+        spec = importlib.util.spec_from_file_location(name, os.path.join(os.path.dirname(__file__), file_name))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return sys.modules[name]
+
+@pytest.fixture(scope="session")
+def example_80_20s():
+    return load_example("example_80-20s.py", "example_80_20s")
+
+@pytest.fixture(scope="session")
+def example_momentum_pinball():
+    return load_example("example_momentum-pinball.py", "example_momentum_pinball")
@@ -1,16 +1,20 @@
 from simulator import AccountSimulator
 from datetime import date, timedelta, datetime
-from market import Market
+from market import Market, EmptyDataError
 from pandas.tseries.offsets import BDay
+import numpy as np
 
 
 class Algorithm8020(AccountSimulator):
-    def __init__(self, start_money, comission, tickers, file_name):
-        super(Algorithm8020, self).__init__(start_money, comission)
+    # low_band, high_band: parts of the day range that Open and Close should be in
+    def __init__(self, start_money, comission, tickers, file_name, provider=None, low_band=0.2, high_band=0.8):
+        super(Algorithm8020, self).__init__(start_money, comission, provider)
         self.__tickers = tickers
+        self.__low_band = low_band
+        self.__high_band = high_band
         self.__tickers_to_sell = {}  # ticker -> price
         self.__tickers_to_buy = {}   # ticker -> price
-        self.__file = open(file_name, "w")
+        self.open_journal(file_name)
 
     # get stocks that complies with algorithm conditions
     def __get_suitable_tickers(self, date, market):
@@ -19,17 +23,20 @@ class Algorithm8020(AccountSimulator):
         self.__tickers_to_sell = {}
         self.__tickers_to_buy = {}
 
-        for ticker in self.__tickers:
-                yesterday_high = market.get_high_day_price(ticker, yesterday)
-                yesterday_low = market.get_low_day_price(ticker, yesterday)
-                yesterday_open = market.get_open_day_price(ticker, yesterday)
-                yesterday_close = market.get_close_day_price(ticker, yesterday)
+        # Open, High, Low, Close, Volume of every ticker at once
+        bars = market.get_day_bars(self.__tickers, yesterday)
+        for ticker, bar in zip(self.__tickers, bars):
+                yesterday_open, yesterday_high, yesterday_low, yesterday_close, _ = bar
+                if np.isnan(yesterday_close):
+                    raise EmptyDataError()
                 range = yesterday_high - yesterday_low
 
-                if (yesterday_open <= 0.2 * range + yesterday_low) and (yesterday_close >= 0.8 * range + yesterday_low): # sell today
+                low_level = self.__low_band * range + yesterday_low
+                high_level = self.__high_band * range + yesterday_low
+                if (yesterday_open <= low_level) and (yesterday_close >= high_level): # sell today
                     if self.get_quantity(ticker) > 0:
                         self.__tickers_to_sell[ticker] = yesterday_close
-                elif (yesterday_close <= 0.2 * range + yesterday_low) and (yesterday_open >= 0.8 * range + yesterday_low): # buy today
+                elif (yesterday_close <= low_level) and (yesterday_open >= high_level): # buy today
                     self.__tickers_to_buy[ticker] = yesterday_close
 
     def check_and_buy(self, market):
@@ -72,22 +79,19 @@ class Algorithm8020(AccountSimulator):
         self.check_and_buy(market)
         self.check_and_sell(market)
 
-        if date.hour == 15 and date.minute == 30:
-            self.print_day_results(self.__file)
+        if self.is_session_end():
+            self.write_day_results()
 
-        end_date = self.get_end_date()
-        if date >= end_date:
-            self.__file.close()
 
+if __name__ == "__main__":
+    start_date = datetime(year=2021, month=3, day=4)
+    end_date = datetime(year=2021, month=6, day=5)
+    comission_percent = 0.00025
 
-start_date = datetime(year=2021, month=3, day=4)
-end_date = datetime(year=2021, month=6, day=5)
-comission_percent = 0.00025
+    time_range_str = start_date.strftime('%Y-%m-%d_%H-%M-%S') + "_" + end_date.strftime('%Y-%m-%d_%H-%M-%S')
+    cur_time_str = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+    file_name = "run_80_20_" + time_range_str + "_" + cur_time_str + "_" + str(comission_percent) + "_comission.jsonl"
 
-time_range_str = start_date.strftime('%Y-%m-%d_%H-%M-%S') + "_" + end_date.strftime('%Y-%m-%d_%H-%M-%S')
-cur_time_str = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
-file_name = "run_80_20_" + time_range_str + "_" + cur_time_str + "_" + str(comission_percent) + "_comission.txt"
-
-tickers = ['IDCC', 'SAP', 'SBUX', 'SGEN']
-ms = Algorithm8020(1000, comission_percent, tickers, file_name)
-ms.run(start_date, end_date)
+    tickers = ['IDCC', 'SAP', 'SBUX', 'SGEN']
+    ms = Algorithm8020(1000, comission_percent, tickers, file_name)
+    ms.run(start_date, end_date)
@@ -1,43 +1,45 @@
 from simulator import AccountSimulator
 from datetime import date, timedelta, datetime
 from market import Market
-from pandas.tseries.offsets import BDay
-import ta
+from indicators import WindowedRocRSI, SessionHighLow
 import matplotlib.pyplot as plt
 
 
 class AlgorithmMomentumPinball(AccountSimulator):
-    def __init__(self, start_money, comission, tickers, file_name):
-        super(AlgorithmMomentumPinball, self).__init__(start_money, comission)
+    # rsi_low, rsi_high: ROC(1) -> RSI(3) levels to set buying and selling stops
+    def __init__(self, start_money, comission, tickers, file_name, provider=None, rsi_low=30, rsi_high=70):
+        super(AlgorithmMomentumPinball, self).__init__(start_money, comission, provider)
         self.__tickers = tickers
+        self.__rsi_low = rsi_low
+        self.__rsi_high = rsi_high
         self.__buying_stops = {}  # ticker -> price for buying
         self.__selling_stops = {}  # ticker -> price for selling
         self.__selling_saving_stops = {}  # ticker -> price
         self.__first_hour_min = {}  # ticker -> min price
-        self.__file = open(file_name, "w")
+        self.open_journal(file_name)
+
+        for ticker in tickers:
+            self.add_indicator(ticker, "lbr_rsi", WindowedRocRSI(7, 1, 3), "1d")
+            self.add_indicator(ticker, "session", SessionHighLow("close"), "1h")
 
     # get stocks that complies with algorithm conditions
+    # indicators have already got yesterday's daily bar and today's first hour bar
     def __get_suitable_tickers(self, date, market):
         for ticker in self.__tickers:
-            date_min_7 = date - BDay(7)
-            yesterday = date - BDay(1)
-            close = market.get_data(ticker, date_min_7, yesterday, "1d")['Close']
-
-            roc_res = ta.momentum.roc(close, 1, True)
-            lbr_rsi = ta.momentum.rsi(roc_res, 3, True)
-
-            if len(lbr_rsi) == 0:
+            lbr_rsi = self.get_indicator(ticker, "lbr_rsi").get_value(date)
+            if lbr_rsi is None:
                 continue
 
-            # if yesterday we had lbr_rsi < 30 => today we set stop for buiying
-            # if yesterday we had lbr_rsi > 70 => today we set stop for selling
-            if lbr_rsi[-1] < 30:
-                first_hour_range = market.get_data(ticker, yesterday, date, "1h")['Close']
-                self.__first_hour_min[ticker] = min(first_hour_range)
-                self.__buying_stops[ticker] = max(first_hour_range)
-            elif lbr_rsi[-1] > 70:
-                first_hour_range = market.get_data(ticker, yesterday, date, "1h")['Close']
-                self.__selling_stops[ticker] = min(first_hour_range)
+            # if yesterday we had lbr_rsi < rsi_low (30) => today we set stop for buiying
+            # if yesterday we had lbr_rsi > rsi_high (70) => today we set stop for selling
+            first_hour = self.get_indicator(ticker, "session")
+            if first_hour.get_day() != date.date():
+                continue
+            if lbr_rsi < self.__rsi_low:
+                self.__first_hour_min[ticker] = first_hour.get_low()
+                self.__buying_stops[ticker] = first_hour.get_high()
+            elif lbr_rsi > self.__rsi_high:
+                self.__selling_stops[ticker] = first_hour.get_low()
 
 
     def check_and_buy(self, date, market):
@@ -92,24 +94,21 @@ class AlgorithmMomentumPinball(AccountSimulator):
         self.check_and_buy(date, market)
         self.check_and_sell(date, market)
 
-        if date.hour == 15 and date.minute == 30:
+        if self.is_session_end():
             self.__buying_stops = {}
-            self.print_day_results(self.__file)
-
-        end_date = self.get_end_date()
-        if date >= end_date:
-            self.__file.close()
+            self.write_day_results()
 
 
-start_date = datetime(year=2021, month=3, day=1)
-end_date = datetime(year=2021, month=6, day=27)
-comission_percent = 0.00025
+if __name__ == "__main__":
+    start_date = datetime(year=2021, month=3, day=1)
+    end_date = datetime(year=2021, month=6, day=27)
+    comission_percent = 0.00025
 
-time_range_str = start_date.strftime('%Y-%m-%d_%H-%M-%S') + "_" + end_date.strftime('%Y-%m-%d_%H-%M-%S')
-cur_time_str = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
-file_name = "run_momentum-pinball_" + time_range_str + "_" + cur_time_str + "_" + str(comission_percent) + "_comission.txt"
+    time_range_str = start_date.strftime('%Y-%m-%d_%H-%M-%S') + "_" + end_date.strftime('%Y-%m-%d_%H-%M-%S')
+    cur_time_str = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+    file_name = "run_momentum-pinball_" + time_range_str + "_" + cur_time_str + "_" + str(comission_percent) + "_comission.jsonl"
 
-tickers = ['IDCC', 'SAP', 'SBUX', 'SGEN']
-ms = AlgorithmMomentumPinball(1000, comission_percent, tickers, file_name)
-ms.run(start_date, end_date)
-ms.history_plot()
+    tickers = ['IDCC', 'SAP', 'SBUX', 'SGEN']
+    ms = AlgorithmMomentumPinball(1000, comission_percent, tickers, file_name)
+    ms.run(start_date, end_date)
+    ms.history_plot()
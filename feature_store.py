@@ -0,0 +1,265 @@
+import os
+import numpy as np
+from market import get_bar_index
+from bar_index import NO_BAR, DAY_NS, to_timestamp
+
+
+class FeatureStoreError(Exception):
+    pass
+
+
+FEATURES = ["open_position", "close_position", "roc", "roc_rsi", "rsi", "atr"]
+RSI_WINDOW = 14
+ROC_RSI_WINDOW = 3
+ATR_WINDOW = 14
+
+# per ticker state of the recursive features after the last stored day
+STATE = ["previous_close", "previous_roc", "rsi_up", "rsi_down", "rsi_count",
+         "roc_rsi_up", "roc_rsi_down", "roc_rsi_count", "atr", "atr_count"]
+
+
+def _rsi(up, down, count, window):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        value = np.where(down == 0, 100.0, 100 - 100 / (1 + up / down))
+    return np.where(count >= window, value, np.nan)
+
+# exponential averages of ups and downs of the values where update is True, as indicators.RSI does
+def _update_rsi(values, previous, up, down, count, update, window):
+    alpha = 1 / window
+    diff = values - previous
+    update = update & ~np.isnan(previous)
+    up[update] = (1 - alpha) * up[update] + alpha * np.maximum(diff[update], 0.0)
+    down[update] = (1 - alpha) * down[update] + alpha * np.maximum(-diff[update], 0.0)
+    count[update] += 1
+
+
+# (date x ticker) matrices of daily features kept in memory mapped files:
+#   <root>/<feature>.<generation>.npy, <root>/dates.<generation>.npy - int64 nanoseconds of the days,
+#   <root>/state.npz - tickers, size, generation of the files and the recursive state of every ticker
+# widened or grown matrices are written as files of the next generation, state.npz is replaced last and
+# the previous generation is deleted after it, so an interrupted update leaves the previous store
+# features of a day describe its daily bar:
+#   open_position, close_position - where Open and Close are in the High - Low range (0 - Low, 1 - High)
+#   roc - ROC(1) of Close in percent, roc_rsi - RSI(3) of roc, rsi - RSI(14) of Close, atr - ATR(14)
+# the same values as the streaming indicators fed with the daily bars
+class FeatureStore:
+    def __init__(self, root):
+        self.__root = root
+        self.__tickers = []
+        self.__size = 0
+        self.__state = {name: np.array([]) for name in STATE}
+        self.__matrices = {}
+        self.__dates = np.array([], dtype=np.int64)
+        self.__generation = 0
+        if os.path.exists(self.__get_path("state.npz")):
+            self.__load()
+
+    def __get_path(self, name):
+        return os.path.join(self.__root, name)
+
+    # file of the dates or a feature, generation 0 files have no number
+    def __get_file(self, name, generation):
+        return self.__get_path(f"{name}.{generation}.npy" if generation > 0 else name + ".npy")
+
+    def __load(self):
+        with np.load(self.__get_path("state.npz")) as state:
+            self.__tickers = [str(ticker) for ticker in state["tickers"]]
+            self.__size = int(state["size"])
+            self.__state = {name: state[name].copy() for name in STATE}
+            self.__generation = int(state["generation"]) if "generation" in state else 0
+        self.__dates = np.load(self.__get_file("dates", self.__generation), mmap_mode="r")
+        self.__matrices = {feature: np.load(self.__get_file(feature, self.__generation), mmap_mode="r")
+                           for feature in FEATURES}
+
+    # only the root is pickled, checkpoints and forks open the same files again
+    def __getstate__(self):
+        return {"root": self.__root}
+
+    def __setstate__(self, state):
+        self.__init__(state["root"])
+
+    def get_root(self):
+        return self.__root
+
+    def get_tickers(self):
+        return self.__tickers
+
+    def __len__(self):
+        return self.__size
+
+    # int64 nanoseconds of the stored days
+    def get_dates(self):
+        return self.__dates[:self.__size]
+
+    # (days, tickers) matrix of the feature, no copying
+    def get_matrix(self, feature):
+        if not feature in self.__matrices:
+            raise FeatureStoreError(f"unknown feature {feature}")
+        return self.__matrices[feature][:self.__size]
+
+    # adds days after the last stored one for the tickers, tickers that are new to the store are computed
+    # from their first bar. Daily bars are read through market.get_bar_index
+    def update(self, tickers=None, provider=None, end_date=None):
+        tickers = list(self.__tickers) if tickers is None else list(tickers)
+        new_tickers = [ticker for ticker in dict.fromkeys(tickers) if not ticker in self.__tickers]
+        all_tickers = self.__tickers + new_tickers
+        end = None if end_date is None else to_timestamp(end_date)
+        last = self.__dates[self.__size - 1] if self.__size > 0 else None
+
+        indices = [get_bar_index(ticker, "1d", provider) for ticker in all_tickers]
+        days = [index.get_dates() - index.get_dates() % DAY_NS for index in indices]
+        new_dates = np.unique(np.concatenate(days + [np.array([], dtype=np.int64)]))
+        if last is not None:
+            new_dates = new_dates[new_dates > last]
+        if end is not None:
+            new_dates = new_dates[new_dates <= end]
+        if len(new_dates) == 0 and len(new_tickers) == 0:
+            return 0
+
+        n_old = len(self.__tickers)
+        state = {name: np.concatenate([self.__state[name], self.__initial_state(name, len(new_tickers))]) for name in STATE}
+        new_state = {name: state[name][n_old:] for name in STATE}     # views
+
+        # the new tickers go over the stored days first
+        stored_dates = np.asarray(self.get_dates())
+        new_columns = {feature: np.full((self.__size, len(new_tickers)), np.nan) for feature in FEATURES}
+        if len(new_tickers) > 0 and self.__size > 0:
+            bars = self.__align(indices[n_old:], days[n_old:], stored_dates)
+            for i in range(self.__size):
+                values = self.__compute(bars[i], new_state)
+                for feature in FEATURES:
+                    new_columns[feature][i] = values[feature]
+
+        rows = {feature: np.full((len(new_dates), len(all_tickers)), np.nan) for feature in FEATURES}
+        bars = self.__align(indices, days, new_dates)
+        for i in range(len(new_dates)):
+            values = self.__compute(bars[i], state)
+            for feature in FEATURES:
+                rows[feature][i] = values[feature]
+
+        self.__write(all_tickers, new_dates, rows, new_columns, state)
+        return len(new_dates)
+
+    @staticmethod
+    def __initial_state(name, n):
+        if name in ("previous_close", "previous_roc", "atr"):
+            return np.full(n, np.nan)
+        return np.zeros(n)
+
+    # (days, 4, tickers) Open, High, Low, Close of every ticker at the days, nan where there is no bar
+    @staticmethod
+    def __align(indices, days, dates):
+        bars = np.full((len(dates), 4, len(indices)), np.nan)
+        for j, (index, ticker_days) in enumerate(zip(indices, days)):
+            if len(ticker_days) == 0:
+                continue
+            positions = np.searchsorted(ticker_days, dates)
+            found = positions < len(ticker_days)
+            found[found] = ticker_days[positions[found]] == dates[found]
+            for k, column in enumerate(["Open", "High", "Low", "Close"]):
+                bars[found, k, j] = np.asarray(index.get_column(column))[positions[found]]
+        return bars
+
+    # features of one day of (4, tickers) bars, the state is updated in place
+    @staticmethod
+    def __compute(bar, s):
+        opens, highs, lows, closes = bar
+        has = ~np.isnan(closes)
+        values = {}
+        with np.errstate(divide="ignore", invalid="ignore"):
+            spread = highs - lows
+            values["open_position"] = np.where(spread > 0, (opens - lows) / spread, np.nan)
+            values["close_position"] = np.where(spread > 0, (closes - lows) / spread, np.nan)
+
+            previous = s["previous_close"]
+            roc = np.where(has & (previous != 0), (closes - previous) / previous * 100, np.nan)
+            values["roc"] = roc
+
+            _update_rsi(closes, previous, s["rsi_up"], s["rsi_down"], s["rsi_count"], has, RSI_WINDOW)
+            values["rsi"] = np.where(has, _rsi(s["rsi_up"], s["rsi_down"], s["rsi_count"], RSI_WINDOW), np.nan)
+
+            has_roc = ~np.isnan(roc)
+            _update_rsi(roc, s["previous_roc"], s["roc_rsi_up"], s["roc_rsi_down"], s["roc_rsi_count"], has_roc, ROC_RSI_WINDOW)
+            values["roc_rsi"] = np.where(has_roc, _rsi(s["roc_rsi_up"], s["roc_rsi_down"], s["roc_rsi_count"], ROC_RSI_WINDOW), np.nan)
+            s["previous_roc"][has_roc] = roc[has_roc]
+
+            true_range = np.where(np.isnan(previous), spread,
+                                  np.maximum(spread, np.maximum(np.abs(highs - previous), np.abs(lows - previous))))
+            atr = s["atr"]
+            first = has & np.isnan(atr)
+            later = has & ~first
+            atr[first] = true_range[first]
+            atr[later] = (1 - 1 / ATR_WINDOW) * atr[later] + true_range[later] / ATR_WINDOW
+            s["atr_count"][has] += 1
+            values["atr"] = np.where(has & (s["atr_count"] >= ATR_WINDOW), atr, np.nan)
+
+            previous[has] = closes[has]
+        return values
+
+    # appends the rows in place while the files have room, otherwise the files are written again
+    def __write(self, tickers, new_dates, rows, new_columns, state):
+        os.makedirs(self.__root, exist_ok=True)
+        size = self.__size + len(new_dates)
+        capacity = len(self.__dates)
+        rewrite = len(tickers) != len(self.__tickers) or size > capacity
+        generation = self.__generation
+        if rewrite:
+            generation += 1
+            capacity = max(16, 2 * size)
+            dates = np.lib.format.open_memmap(self.__get_file("dates", generation), mode="w+", dtype=np.int64, shape=(capacity,))
+            dates[:self.__size] = self.get_dates()
+            dates[self.__size:size] = new_dates
+            dates.flush()
+            del dates
+            for feature in FEATURES:
+                matrix = np.lib.format.open_memmap(self.__get_file(feature, generation), mode="w+", dtype=np.float64,
+                                                   shape=(capacity, len(tickers)))
+                n_old = len(self.__tickers)
+                if self.__size > 0:
+                    matrix[:self.__size, :n_old] = self.get_matrix(feature)
+                    matrix[:self.__size, n_old:] = new_columns[feature]
+                matrix[self.__size:size] = rows[feature]
+                matrix.flush()
+                del matrix
+        else:
+            dates = np.load(self.__get_file("dates", generation), mmap_mode="r+")
+            dates[self.__size:size] = new_dates
+            dates.flush()
+            del dates
+            for feature in FEATURES:
+                matrix = np.load(self.__get_file(feature, generation), mmap_mode="r+")
+                matrix[self.__size:size] = rows[feature]
+                matrix.flush()
+                del matrix
+
+        np.savez(self.__get_path("state.tmp.npz"), tickers=np.array(tickers, dtype=str), size=size,
+                 generation=generation, **state)
+        os.replace(self.__get_path("state.tmp.npz"), self.__get_path("state.npz"))
+        previous = self.__generation
+        self.__matrices = {}
+        self.__dates = np.array([], dtype=np.int64)
+        self.__load()
+        if generation != previous:
+            for name in ["dates"] + FEATURES:
+                path = self.__get_file(name, previous)
+                if os.path.exists(path):
+                    os.remove(path)
+
+    # position of the last day that is over at the date, NO_BAR if there is none
+    def asof(self, date):
+        now = to_timestamp(date)
+        position = int(np.searchsorted(self.get_dates(), now - DAY_NS, side="right")) - 1
+        return NO_BAR if position < 0 else position
+
+    # {feature: values of all tickers} of the last day that is over at the date
+    def get_features(self, date):
+        position = self.asof(date)
+        if position == NO_BAR:
+            return {feature: np.full(len(self.__tickers), np.nan) for feature in FEATURES}
+        return {feature: self.__matrices[feature][position] for feature in FEATURES}
+
+    # tickers that predicate(features) marks True, features as get_features returns them, e.g.
+    # store.screen(date, lambda f: (f["open_position"] <= 0.2) & (f["close_position"] >= 0.8))
+    def screen(self, date, predicate):
+        mask = np.asarray(predicate(self.get_features(date)), dtype=bool)
+        return [self.__tickers[i] for i in np.flatnonzero(mask)]
@@ -0,0 +1,328 @@
+from collections import deque
+from datetime import timedelta
+import numpy as np
+from bar_index import Bar, to_timestamp
+from market import get_bar_index
+from providers import INTRADAY_MINUTES
+
+
+class IndicatorError(Exception):
+    pass
+
+
+# streaming indicator: keeps O(window) state and updates in O(1) per new value
+# get_value returns None until there is enough data
+class Indicator:
+    def __init__(self, field="close"):
+        self._field = field   # bar field the indicator is computed of
+
+    def update(self, value):
+        raise NotImplementedError()
+
+    def get_value(self):
+        raise NotImplementedError()
+
+    def is_ready(self):
+        return self.get_value() is not None
+
+    def update_bar(self, date, bar):
+        return self.update(getattr(bar, self._field))
+
+
+class SMA(Indicator):
+    def __init__(self, window, field="close"):
+        super(SMA, self).__init__(field)
+        self.__window = window
+        self.__values = deque()
+        self.__sum = 0
+
+    def update(self, value):
+        self.__values.append(value)
+        self.__sum += value
+        if len(self.__values) > self.__window:
+            self.__sum -= self.__values.popleft()
+        return self.get_value()
+
+    def get_value(self):
+        if len(self.__values) < self.__window:
+            return None
+        return self.__sum / self.__window
+
+
+# exponential moving average: value = (1 - alpha) * value + alpha * new value
+# alpha is 2 / (window + 1) if it is not given
+class EMA(Indicator):
+    def __init__(self, window, alpha=None, field="close"):
+        super(EMA, self).__init__(field)
+        self.__alpha = 2 / (window + 1) if alpha is None else alpha
+        self.__value = None
+
+    def update(self, value):
+        if self.__value is None:
+            self.__value = value
+        else:
+            self.__value = (1 - self.__alpha) * self.__value + self.__alpha * value
+        return self.__value
+
+    def get_value(self):
+        return self.__value
+
+
+# rate of change in percent over window values
+class ROC(Indicator):
+    def __init__(self, window=1, field="close"):
+        super(ROC, self).__init__(field)
+        self.__values = deque(maxlen=window + 1)
+        self.__value = None
+
+    def update(self, value):
+        self.__values.append(value)
+        if len(self.__values) == self.__values.maxlen and self.__values[0] != 0:
+            self.__value = (value - self.__values[0]) / self.__values[0] * 100
+        return self.__value
+
+    def get_value(self):
+        return self.__value
+
+
+# relative strength index with exponential averages of ups and downs (alpha = 1 / window) as ta computes it
+class RSI(Indicator):
+    def __init__(self, window=14, field="close"):
+        super(RSI, self).__init__(field)
+        self.__window = window
+        self.__alpha = 1 / window
+        self.__previous = None
+        self.__up = 0.0
+        self.__down = 0.0
+        self.__count = 0
+
+    def update(self, value):
+        if self.__previous is not None:
+            diff = value - self.__previous
+            self.__up = (1 - self.__alpha) * self.__up + self.__alpha * max(diff, 0.0)
+            self.__down = (1 - self.__alpha) * self.__down + self.__alpha * max(-diff, 0.0)
+            self.__count += 1
+        self.__previous = value
+        return self.get_value()
+
+    def get_value(self):
+        if self.__count < self.__window:
+            return None
+        if self.__down == 0:
+            return 100.0
+        return 100 - 100 / (1 + self.__up / self.__down)
+
+
+# average true range with exponential averaging (alpha = 1 / window) started from the first true range
+class ATR(Indicator):
+    def __init__(self, window=14):
+        super(ATR, self).__init__("close")
+        self.__window = window
+        self.__previous_close = None
+        self.__value = None
+        self.__count = 0
+
+    def update(self, value):
+        return self.update_bar(None, Bar(value, value, value, value, 0))
+
+    def update_bar(self, date, bar):
+        true_range = bar.high - bar.low
+        if self.__previous_close is not None:
+            true_range = max(true_range, abs(bar.high - self.__previous_close), abs(bar.low - self.__previous_close))
+        if self.__value is None:
+            self.__value = true_range
+        else:
+            self.__value = (1 - 1 / self.__window) * self.__value + true_range / self.__window
+        self.__previous_close = bar.close
+        self.__count += 1
+        return self.get_value()
+
+    def get_value(self):
+        if self.__count < self.__window:
+            return None
+        return self.__value
+
+
+# minimum of the last window values, monotonic queue of (number, value)
+class RollingMin(Indicator):
+    def __init__(self, window, field="low"):
+        super(RollingMin, self).__init__(field)
+        self.__window = window
+        self.__values = deque()
+        self.__count = 0
+
+    def _is_better(self, a, b):
+        return a <= b
+
+    def update(self, value):
+        while len(self.__values) > 0 and self._is_better(value, self.__values[-1][1]):
+            self.__values.pop()
+        self.__values.append((self.__count, value))
+        if self.__values[0][0] <= self.__count - self.__window:
+            self.__values.popleft()
+        self.__count += 1
+        return self.get_value()
+
+    def get_value(self):
+        if self.__count < self.__window:
+            return None
+        return self.__values[0][1]
+
+class RollingMax(RollingMin):
+    def __init__(self, window, field="high"):
+        super(RollingMax, self).__init__(window, field)
+
+    def _is_better(self, a, b):
+        return a >= b
+
+
+# high and low of the current session, reset by the first bar of a new day
+# field=None takes bar High and Low, a field ("close") takes the highest and the lowest value of it
+class SessionHighLow(Indicator):
+    def __init__(self, field=None):
+        super(SessionHighLow, self).__init__("close" if field is None else field)
+        self.__of_field = field is not None
+        self.__day = None
+        self.__high = None
+        self.__low = None
+
+    def update(self, value):
+        return self.update_bar(self.__day, Bar(value, value, value, value, 0))
+
+    def update_bar(self, date, bar):
+        day = None if date is None else date.date()
+        high = getattr(bar, self._field) if self.__of_field else bar.high
+        low = getattr(bar, self._field) if self.__of_field else bar.low
+        if day != self.__day:
+            self.__day = day
+            self.__high = high
+            self.__low = low
+        else:
+            self.__high = max(self.__high, high)
+            self.__low = min(self.__low, low)
+        return self.get_value()
+
+    def get_day(self):
+        return self.__day
+    def get_high(self):
+        return self.__high
+    def get_low(self):
+        return self.__low
+
+    def get_value(self):
+        if self.__high is None:
+            return None
+        return (self.__high, self.__low)
+
+
+# indicator of an indicator: Chain(ROC(1), RSI(3)) is RSI(3) of ROC(1) values
+class Chain(Indicator):
+    def __init__(self, *indicators):
+        if len(indicators) == 0:
+            raise IndicatorError("chain of no indicators")
+        super(Chain, self).__init__(indicators[0]._field)
+        self.__indicators = indicators
+
+    def update(self, value):
+        for indicator in self.__indicators:
+            value = indicator.update(value)
+            if value is None:
+                return None
+        return value
+
+    def get_value(self):
+        return self.__indicators[-1].get_value()
+
+
+# RSI(rsi_window) of ROC(roc_window) recomputed over the daily values of the last days business days,
+# as ta.momentum.roc and rsi with fillna compute them over a date slice: missing ROC values are 0 and the
+# exponential averages start from the first ROC difference. O(days) per value
+# get_value(date) takes the days before the date, without a date the days up to the last value
+class WindowedRocRSI(Indicator):
+    def __init__(self, days=7, roc_window=1, rsi_window=3, field="close"):
+        super(WindowedRocRSI, self).__init__(field)
+        self.__days = days
+        self.__roc_window = roc_window
+        self.__alpha = 1 / rsi_window
+        self.__values = deque()   # (day, value)
+
+    def update(self, value):
+        day = np.busday_offset(self.__values[-1][0], 1) if len(self.__values) > 0 else np.datetime64(0, "D")
+        return self.update_bar(day, Bar(value, value, value, value, 0))
+
+    def update_bar(self, date, bar):
+        day = np.datetime64(date, "D")
+        self.__values.append((day, getattr(bar, self._field)))
+        first = np.busday_offset(day, -self.__days, roll="forward")
+        while self.__values[0][0] < first:
+            self.__values.popleft()
+        return self.get_value()
+
+    def get_value(self, date=None):
+        if len(self.__values) == 0:
+            return None
+        end = np.busday_offset(self.__values[-1][0], 1) if date is None else np.datetime64(date, "D")
+        start = np.busday_offset(end, -self.__days, roll="forward")
+        values = [value for day, value in self.__values if start <= day < end]
+        if len(values) == 0:
+            return None
+
+        rocs = []
+        for i, value in enumerate(values):
+            previous = values[i - self.__roc_window] if i >= self.__roc_window else None
+            if previous is None or previous == 0 or np.isnan(previous) or np.isnan(value):
+                rocs.append(rocs[-1] if len(rocs) > 0 else 0.0)
+            else:
+                rocs.append((value - previous) / previous * 100)
+        up = 0.0
+        down = 0.0
+        for i in range(1, len(rocs)):
+            diff = rocs[i] - rocs[i - 1]
+            up = (1 - self.__alpha) * up + self.__alpha * max(diff, 0.0)
+            down = (1 - self.__alpha) * down + self.__alpha * max(-diff, 0.0)
+        if down == 0:
+            return 100.0
+        return 100 - 100 / (1 + up / down)
+
+
+def get_interval_length(interval):
+    if interval in INTRADAY_MINUTES:
+        return timedelta(minutes=INTRADAY_MINUTES[interval])
+    days = {"1d": 1, "5d": 5, "1wk": 7, "1mo": 31, "3mo": 92}
+    if not interval in days:
+        raise IndicatorError(f"unknown interval {interval}")
+    return timedelta(days=days[interval])
+
+
+# indicators registered per (ticker, interval) that are fed with bars as the clock advances
+# a bar is fed once it is over: bar date + interval length <= the clock
+class IndicatorSet:
+    def __init__(self, provider=None):
+        self.__provider = provider
+        self.__indicators = {}   # ticker -> {name -> indicator}
+        self.__series = {}       # (ticker, interval) -> [(name, indicator)]
+        self.__positions = {}    # (ticker, interval) -> number of bars fed
+
+    def add(self, ticker, name, indicator, interval="1d"):
+        self.__indicators.setdefault(ticker, {})[name] = indicator
+        self.__series.setdefault((ticker, interval), []).append((name, indicator))
+
+    def get(self, ticker, name):
+        return self.__indicators[ticker][name]
+
+    def get_indicators(self):
+        return self.__indicators
+
+    def advance(self, date):
+        now = to_timestamp(date)
+        for (ticker, interval), indicators in self.__series.items():
+            index = get_bar_index(ticker, interval, self.__provider)
+            dates = index.get_dates()
+            position = self.__positions.get((ticker, interval), 0)
+            end = int(np.searchsorted(dates, now - get_interval_length(interval) // timedelta(microseconds=1) * 1000, side="right"))
+            for i in range(position, end):
+                bar = index.get_bar(i)
+                bar_date = np.datetime64(int(dates[i]), "ns").astype("datetime64[us]").item()
+                for name, indicator in indicators:
+                    indicator.update_bar(bar_date, bar)
+            self.__positions[(ticker, interval)] = max(position, end)
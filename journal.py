@@ -0,0 +1,106 @@
+import json
+import queue
+import threading
+from datetime import datetime
+import numpy as np
+from ledger import Ledger, SIDES
+
+
+class JournalError(Exception):
+    pass
+
+
+# line-oriented journal of a run, a JSON array per line:
+#   ["fill", date, ticker, "buy"/"sell", quantity, price, comission]
+#   ["day", date, portfolio cost, free money, stocks cost, {ticker: quantity}]
+# records are written by a background thread so the simulation never waits for the file
+class RunJournal:
+    def __init__(self, path, mode="w", buffering=1 << 16):
+        self.__path = path
+        self.__file = open(path, mode, buffering=buffering)
+        self.__queue = queue.Queue()
+        self.__error = None
+        self.__closed = False
+        self.__thread = threading.Thread(target=self.__write_loop, name="journal writer", daemon=True)
+        self.__thread.start()
+
+    def get_path(self):
+        return self.__path
+
+    def __write_loop(self):
+        while True:
+            records = self.__queue.get()
+            if records is None:
+                self.__queue.task_done()
+                break
+            if self.__error is None:
+                try:
+                    self.__file.write("".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records))
+                except Exception as e:
+                    self.__error = e
+            self.__queue.task_done()
+
+    # records are lists that are not changed afterwards
+    def write(self, records):
+        if self.__closed:
+            raise JournalError(f"journal {self.__path} is closed")
+        if len(records) > 0:
+            self.__queue.put(records)
+
+    def write_fills(self, ledger, first_row):
+        rows = range(first_row, len(ledger))
+        if len(rows) == 0:
+            return
+        tickers = ledger.get_tickers()
+        dates = np.datetime_as_string(ledger.get_column("date")[first_row:].astype("datetime64[ns]").astype("datetime64[us]"))
+        ticker_ids = ledger.get_column('ticker_id')
+        sides = ledger.get_column('side')
+        quantities = ledger.get_column('quantity')
+        prices = ledger.get_column('price')
+        comissions = ledger.get_column('comission')
+        self.write([["fill", str(dates[i - first_row]), tickers[ticker_ids[i]], SIDES[sides[i]],
+                     int(quantities[i]), float(prices[i]), float(comissions[i])] for i in rows])
+
+    def write_day(self, date, portfolio_cost, free_money, active_money, quantities):
+        self.write([["day", date.isoformat(), portfolio_cost, free_money, active_money, quantities]])
+
+    # waits until everything written so far is in the file, returns the file size
+    def sync(self):
+        if self.__closed:
+            raise JournalError(f"journal {self.__path} is closed")
+        self.__queue.join()
+        if self.__error is not None:
+            raise JournalError(f"journal {self.__path} was not written") from self.__error
+        self.__file.flush()
+        return self.__file.tell()
+
+    def close(self):
+        if self.__closed:
+            return
+        self.__closed = True
+        self.__queue.put(None)
+        self.__thread.join()
+        self.__file.close()
+        if self.__error is not None:
+            raise JournalError(f"journal {self.__path} was not written") from self.__error
+
+
+# rebuilds the history of a run from its journal
+# returns (Ledger of all fills, [(date, portfolio cost, free money, stocks cost, {ticker: quantity})])
+def read_journal(path):
+    ledger = Ledger()
+    days = []
+    with open(path) as file:
+        for line in file:
+            if line.strip() == "":
+                continue
+            record = json.loads(line)
+            if record[0] == "fill":
+                _, date, ticker, side, quantity, price, comission = record
+                ledger.append(datetime.fromisoformat(date), ticker, SIDES.index(side), quantity, price, comission)
+            elif record[0] == "day":
+                _, date, portfolio_cost, free_money, active_money, quantities = record
+                days.append((datetime.fromisoformat(date), portfolio_cost, free_money, active_money, quantities))
+            else:
+                raise JournalError(f"unknown journal record {record[0]}")
+    return ledger, days
@@ -0,0 +1,221 @@
+import numpy as np
+import pandas as pd
+from bar_index import to_timestamp
+
+
+BUY = 0
+SELL = 1
+SIDES = ['buy', 'sell']
+ALL = -1   # quantity of a sale of all owned stocks
+
+
+# int64 array that doubles its capacity when it is full
+class GrowingArray:
+    def __init__(self, dtype=np.int64, capacity=16):
+        self.__data = np.empty(capacity, dtype=dtype)
+        self.__size = 0
+
+    def __len__(self):
+        return self.__size
+
+    def append(self, value):
+        if self.__size == len(self.__data):
+            self.__data = np.resize(self.__data, 2 * len(self.__data))
+        self.__data[self.__size] = value
+        self.__size += 1
+
+    # room for capacity values without growing
+    def reserve(self, capacity):
+        if capacity > len(self.__data):
+            self.__data = np.resize(self.__data, capacity)
+
+    # view of the values, no copying
+    def get_values(self):
+        return self.__data[:self.__size]
+
+    def copy(self):
+        array = GrowingArray(self.__data.dtype, len(self.__data))
+        array.__data[:self.__size] = self.__data[:self.__size]
+        array.__size = self.__size
+        return array
+
+    # pickles only the values
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_GrowingArray__data'] = self.__data[:max(1, self.__size)].copy()
+        return state
+
+
+# rows of typed columns growing geometrically, tickers are stored as ids given in the order they are first seen
+class ColumnArrays:
+    def __init__(self, names, dtypes, capacity=16):
+        self.__names = list(names)
+        self.__columns = {name: np.empty(capacity, dtype=dtype) for name, dtype in zip(names, dtypes)}
+        self.__size = 0
+        self.__tickers = []        # ticker id -> ticker
+        self.__ticker_ids = {}     # ticker -> ticker id
+
+    def __len__(self):
+        return self.__size
+
+    def get_tickers(self):
+        return self.__tickers
+
+    def get_ticker_id(self, ticker):
+        return self.__ticker_ids.get(ticker)
+
+    # id of the ticker, a new one if the ticker was not seen
+    def add_ticker(self, ticker):
+        if not ticker in self.__ticker_ids:
+            self.__ticker_ids[ticker] = len(self.__tickers)
+            self.__tickers.append(ticker)
+        return self.__ticker_ids[ticker]
+
+    # view of a column, no copying. Values of the rows can be changed through it
+    def get_column(self, name):
+        return self.__columns[name][:self.__size]
+
+    def __getitem__(self, name):
+        return self.get_column(name)
+
+    def __grow(self):
+        capacity = max(1, 2 * len(self.__columns[self.__names[0]]))
+        for name in self.__names:
+            self.__columns[name] = np.resize(self.__columns[name], capacity)
+
+    # values in the order of the names, returns the row number
+    def append(self, values):
+        if self.__size == len(self.__columns[self.__names[0]]):
+            self.__grow()
+        row = self.__size
+        for name, value in zip(self.__names, values):
+            self.__columns[name][row] = value
+        self.__size += 1
+        return row
+
+    def copy(self):
+        arrays = ColumnArrays.__new__(ColumnArrays)
+        arrays.__names = self.__names
+        arrays.__columns = {name: column.copy() for name, column in self.__columns.items()}
+        arrays.__size = self.__size
+        arrays.__tickers = list(self.__tickers)
+        arrays.__ticker_ids = dict(self.__ticker_ids)
+        return arrays
+
+    # pickles only the rows written
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_ColumnArrays__columns'] = {name: column[:max(1, self.__size)].copy() for name, column in self.__columns.items()}
+        return state
+
+
+# history of operations stored by columns:
+# date (int64 nanoseconds), ticker id, side (BUY/SELL), quantity, price, comission
+# row numbers of every (ticker, side) are kept so views of a ticker do not scan the whole history
+# forks share the rows written before the fork until one of them appends (copy on write)
+class Ledger:
+    COLUMNS = ['date', 'ticker_id', 'side', 'quantity', 'price', 'comission']
+    DTYPES = [np.int64, np.int32, np.int8, np.int64, np.float64, np.float64]
+
+    def __init__(self, capacity=1024):
+        self.__columns = ColumnArrays(self.COLUMNS, self.DTYPES, capacity)
+        self.__rows = {}           # (ticker id, side) -> GrowingArray of row numbers
+        self.__shared = False      # arrays are shared with a fork
+
+    def __len__(self):
+        return len(self.__columns)
+
+    # tickers in the order of their first operation
+    def get_tickers(self):
+        return self.__columns.get_tickers()
+
+    def get_ticker_id(self, ticker):
+        return self.__columns.get_ticker_id(ticker)
+
+    # a ledger with the same rows, the arrays are copied when either of them appends
+    def fork(self):
+        child = Ledger.__new__(Ledger)
+        child.__columns = self.__columns
+        child.__rows = dict(self.__rows)
+        child.__shared = True
+        self.__shared = True
+        return child
+
+    def __unshare(self):
+        self.__columns = self.__columns.copy()
+        self.__rows = {key: rows.copy() for key, rows in self.__rows.items()}
+        self.__shared = False
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_Ledger__shared'] = False
+        return state
+
+    def append(self, date, ticker, side, quantity, price, comission):
+        if self.__shared:
+            self.__unshare()
+        ticker_id = self.__columns.add_ticker(ticker)
+        if not (ticker_id, BUY) in self.__rows:
+            self.__rows[(ticker_id, BUY)] = GrowingArray()
+            self.__rows[(ticker_id, SELL)] = GrowingArray()
+        row = self.__columns.append([to_timestamp(date), ticker_id, side, quantity, price, comission])
+        self.__rows[(ticker_id, side)].append(row)
+
+    # view of a column, no copying
+    def get_column(self, name):
+        return self.__columns.get_column(name)
+
+    # row numbers of the ticker operations, of one side or of both sides in time order
+    def get_rows(self, ticker, side=None):
+        ticker_id = self.get_ticker_id(ticker)
+        if ticker_id is None:
+            return np.array([], dtype=np.int64)
+        if side is not None:
+            return self.__rows[(ticker_id, side)].get_values()
+        return np.sort(np.concatenate([self.__rows[(ticker_id, BUY)].get_values(),
+                                       self.__rows[(ticker_id, SELL)].get_values()]))
+
+    # (dates, prices) of the ticker operations of the side
+    def get_side_history(self, ticker, side):
+        rows = self.get_rows(ticker, side)
+        dates = pd.DatetimeIndex(self.get_column('date')[rows].astype("datetime64[ns]"))
+        return dates, self.get_column('price')[rows]
+
+    # [(date, 'buy'/'sell', quantity, price, comission)] of the rows
+    def get_operations(self, rows):
+        dates = pd.DatetimeIndex(self.get_column('date')[rows].astype("datetime64[ns]")).to_pydatetime()
+        sides = self.get_column('side')[rows]
+        quantities = self.get_column('quantity')[rows]
+        prices = self.get_column('price')[rows]
+        comissions = self.get_column('comission')[rows]
+        return [(dates[i], SIDES[sides[i]], int(quantities[i]), float(prices[i]), float(comissions[i]))
+                for i in range(len(rows))]
+
+    def get_ticker_history(self, ticker):
+        return self.get_operations(self.get_rows(ticker))
+
+    # ticker -> [(date, 'buy'/'sell', quantity, price, comission)]
+    def get_history(self):
+        return {ticker: self.get_ticker_history(ticker) for ticker in self.get_tickers()}
+
+    def to_frame(self):
+        n = len(self)
+        return pd.DataFrame({
+            'date': self.get_column('date').astype("datetime64[ns]"),
+            'ticker': np.array(self.get_tickers(), dtype=object)[self.get_column('ticker_id')] if n > 0 else np.array([], dtype=object),
+            'side': np.array(SIDES, dtype=object)[self.get_column('side')] if n > 0 else np.array([], dtype=object),
+            'quantity': self.get_column('quantity'),
+            'price': self.get_column('price'),
+            'comission': self.get_column('comission'),
+        })
+
+    def export_csv(self, path):
+        self.to_frame().to_csv(path, index=False)
+
+    # requires pyarrow or fastparquet
+    def export_parquet(self, path):
+        self.to_frame().to_parquet(path, index=False)
+
+    def export_npz(self, path):
+        columns = {name: self.get_column(name) for name in self.COLUMNS}
+        np.savez(path, tickers=np.array(self.get_tickers(), dtype=str), **columns)
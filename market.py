@@ -1,8 +1,17 @@
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import date, datetime, timedelta
+import numpy as np
 import pandas as pd
-import yfinance as yf
 from functools import lru_cache
+from time import perf_counter
 from pandas.tseries.offsets import BDay
+from bar_store import BarStore
+from providers import YahooProvider, empty_frame, resample
+from bar_index import BarIndex, NO_BAR, BAR_COLUMNS, to_timestamp
+from trading_calendar import get_default_calendar
 
 
 class MarketError(Exception):
@@ -23,49 +32,268 @@ class IntervalError(MarketError):
 class EmptyDataError(MarketError):
     pass
 
+# bars are downloaded into the bar store and read from it afterwards
+# MARKET_BAR_STORE and MARKET_OFFLINE environment variables allow to configure it for every process of a sweep
+_bar_store = BarStore(os.environ["MARKET_BAR_STORE"]) if os.environ.get("MARKET_BAR_STORE") else None
+_offline = os.environ.get("MARKET_OFFLINE", "0") not in ["", "0", "false", "False"]
+_default_provider = YahooProvider()
+
+
+class OfflineError(MarketError):
+    pass
+
+
+# path is None => bars are kept in memory only
+# refresh_interval: seconds after which stored bars are completed with newly available ones
+def set_bar_store(path, refresh_interval=12 * 60 * 60):
+    global _bar_store
+    _bar_store = None if path is None else BarStore(path, refresh_interval)
+    get_data.cache_clear()
+    get_bar_index.cache_clear()
+
+def get_bar_store():
+    return _bar_store
+
+# in offline mode the network is never used: only stored bars and local providers are available
+def set_offline(offline=True):
+    global _offline
+    _offline = offline
+    get_data.cache_clear()
+    get_bar_index.cache_clear()
+
+def is_offline():
+    return _offline
+
+# provider used by markets that were created without one
+def set_default_provider(provider):
+    global _default_provider
+    _default_provider = provider
+    get_data.cache_clear()
+    get_bar_index.cache_clear()
+
+def get_default_provider():
+    return _default_provider
+
+
 # download all data available
 # valid intervals: 1m,2m,5m,15m,30m,60m,90m,1h,1d,5d,1wk,1mo,3mo
+# bars of remote providers that are already in the bar store are not downloaded again, only the missing tail is
+# intervals the provider builds from a finer one are aggregated from its cached bars, so every level
+# of the pyramid is kept here and the finest bars are downloaded once per ticker
 @lru_cache(maxsize=500)
-def get_data(ticker, interval):
-    if interval in ["1d", "5d", "1wk", "1mo", "3mo"]:
-        return yf.download(ticker, interval=interval, period="max")
+def get_data(ticker, interval, provider=None):
+    if provider is None:
+        provider = _default_provider
+    base = provider.get_base_interval(interval)
+    if base is not None:
+        return resample(get_data(ticker, base, provider), interval)
+    if not provider.is_remote():
+        return provider.download(ticker, interval)
+
+    store = _bar_store
+    if store is None:
+        if _offline:
+            raise OfflineError(f"no bar store to read {ticker} {interval} data from in offline mode")
+        return provider.download(ticker, interval)
+
+    data = store.load(ticker, interval)
+    if _offline or (data is not None and store.is_fresh(ticker, interval)):
+        return empty_frame() if data is None else data
+
+    if data is None or data.empty:
+        data = store.append(ticker, interval, provider.download(ticker, interval))
+    else:
+        last_date = data.index[-1].to_pydatetime()
+        data = store.append(ticker, interval, provider.download(ticker, interval, last_date))
+    return empty_frame() if data is None else data
+
+
+# as of lookup index over the bars of get_data
+@lru_cache(maxsize=500)
+def get_bar_index(ticker, interval, provider=None):
+    if provider is None:
+        provider = _default_provider
+    index = provider.get_bar_index(ticker, interval)
+    if index is not None:
+        return index
+    return BarIndex.from_frame(get_data(ticker, interval, provider))
 
-    if interval == "1m":
-        delta = timedelta(days=7)
-    elif interval in ["2m", "5m", "15m", "30m", "90m"]:
-        delta = timedelta(days=59)
-    else:          # interval in ["60m", "1h"]
-        delta = timedelta(days=729)
 
-    start_period = datetime.now() - delta
-    return yf.download(ticker, interval=interval, start=start_period)
 
+# check if the provider is able to download the data of the interval at the date
+# bars kept in the bar store may be older than the provider allows to download
+def is_interval_available(provider, interval, date):
+    if provider.is_remote() and _bar_store is not None:
+        return True
+    limit = provider.get_history_limit(interval)
+    if limit is None:
+        return True
+    return (datetime.now(date.tzinfo) - date).days < limit.days
+
+
+def print_progress(done, total, ticker, interval, error):
+    status = "failed" if error is not None else "ok"
+    print(f"prefetch {done}/{total}: {ticker} {interval} {status}", file=sys.stderr)
+
+
+# loads every (ticker, interval) series into the caches by threads workers before a run
+# intervals that the provider can not serve for the [start_date, end_date] period are skipped,
+# intervals aggregated from a finer one are built after it is loaded. Series that start after the first
+# session from start_date are reported as failures as they do not cover the period
+# Failed downloads are retried retries times with a growing delay, offline errors are not retried
+# progress(done, total, ticker, interval, error) is called after every series, error is None on success
+# returns {ticker: {interval: error message}} of the series that could not be loaded
+def prefetch(tickers, intervals, provider=None, start_date=None, end_date=None, threads=8, retries=2,
+             retry_delay=1.0, progress=print_progress):
+    if provider is None:
+        provider = _default_provider
+    if end_date is not None:
+        intervals = [interval for interval in intervals if is_interval_available(provider, interval, end_date)]
+
+    downloads = []   # finest intervals that are really downloaded
+    for interval in intervals:
+        base = provider.get_base_interval(interval)
+        interval = interval if base is None else base
+        if not interval in downloads:
+            downloads.append(interval)
+    jobs = [(ticker, interval) for ticker in tickers for interval in downloads]
+
+    def load(ticker, interval):
+        for attempt in range(retries + 1):
+            try:
+                get_data(ticker, interval, provider)
+                get_bar_index(ticker, interval, provider)
+                return None
+            except OfflineError as e:
+                return f"{type(e).__name__}: {e}"
+            except Exception as e:
+                if attempt == retries:
+                    return f"{type(e).__name__}: {e}"
+                time.sleep(retry_delay * 2 ** attempt)
+
+    failures = {}
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        futures = {pool.submit(load, ticker, interval): (ticker, interval) for ticker, interval in jobs}
+        for done, future in enumerate(as_completed(futures), 1):
+            ticker, interval = futures[future]
+            error = future.result()
+            if error is not None:
+                failures.setdefault(ticker, {})[interval] = error
+            if progress is not None:
+                progress(done, len(jobs), ticker, interval, error)
+
+    first_close = None
+    if start_date is not None:
+        _, closes = get_default_calendar().get_sessions(start_date, start_date + timedelta(days=10))
+        first_close = closes[0].astype(np.int64) if len(closes) > 0 else None
+
+    # aggregated intervals of the loaded series and the start of every series
+    for ticker in tickers:
+        for interval in intervals:
+            base = provider.get_base_interval(interval)
+            if (interval if base is None else base) in failures.get(ticker, {}):
+                continue
+            try:
+                dates = get_bar_index(ticker, interval, provider).get_dates()
+            except Exception as e:
+                failures.setdefault(ticker, {})[interval] = f"{type(e).__name__}: {e}"
+                continue
+            if first_close is not None and (len(dates) == 0 or dates[0] >= first_close):
+                first = "no bars" if len(dates) == 0 else f"bars start at {pd.Timestamp(dates[0])}"
+                failures.setdefault(ticker, {})[interval] = f"{first}, after {start_date}"
+    return failures
+
+
+# {name: cache_info()} of the bar caches shared by all markets
+def get_cache_infos():
+    return {"bar_cache.get_data": get_data.cache_info(), "bar_cache.get_bar_index": get_bar_index.cache_info()}
 
 
 # market for a particular date
+# the clock can be moved forward with advance, current prices are read through per ticker cursors
 class Market:
-    def __init__(self, date):
+    def __init__(self, date, provider=None):
+        self.__provider = get_default_provider() if provider is None else provider
+        self.__indices = {}   # (ticker, interval) -> BarIndex
+        self.__cursors = {}   # (ticker, interval) -> position of the current bar
+        self.__profiler = None
+        self.__price_interval = None   # interval of the current prices, chosen by the date if None
+        self.__set_date(date)
+
+    def get_provider(self):
+        return self.__provider
+
+    def get_date(self):
+        return self.__date
+
+    # current prices are closes of the interval bars at or before the date, None restores the choice by the date
+    def set_price_interval(self, interval):
+        self.__price_interval = interval
+        self.__current_interval = None
+        self.__current_prices = {}
+    def get_price_interval(self):
+        return self.__price_interval
+
+    # lookups are counted and data loading is timed by the profiler, None disables it
+    def set_profiler(self, profiler):
+        self.__profiler = profiler
+    def get_profiler(self):
+        return self.__profiler
+
+    def __set_date(self, date):
         self.__date = date
-
-
-    # difference between date and current (real) time
-    # as yfinance may refuse to download old data with small intervals
-    def __get_cur_time_diff(self, date):
-        tzinfo = date.tzinfo
-        cur_time = datetime.now(tzinfo)
-        return cur_time - date
-
-
-    # check if yfinance is able to download the data
+        self.__timestamp = to_timestamp(date)
+        self.__current_interval = None   # resolved on the first price request
+        self.__current_prices = {}       # ticker -> price at the current date
+
+    # move the clock, cursors follow it on the next request
+    # the current prices are kept if the date does not change, so accounts sharing the market look them up once
+    def advance(self, date):
+        if date != self.__date:
+            self.__set_date(date)
+
+
+    def __get_index(self, ticker, interval):
+        key = (ticker, interval)
+        index = self.__indices.get(key)
+        if index is None:
+            begin = perf_counter()
+            index = get_bar_index(ticker, interval, self.__provider)
+            self.__indices[key] = index
+            if self.__profiler is not None:
+                self.__profiler.stop("market.load", begin)
+        return index
+
+    # position of the last bar at or before the current date
+    # usually the cursor moves by at most one bar since the previous request
+    def __get_cursor(self, ticker, interval, index):
+        key = (ticker, interval)
+        dates = index.get_dates()
+        position = self.__cursors.get(key)
+        now = self.__timestamp
+        if position is None or (position != NO_BAR and dates[position] > now):
+            position = index.asof(self.__date)
+            if self.__profiler is not None:
+                self.__profiler.count("market.cursor.miss")
+        elif position + 1 < len(dates) and dates[position + 1] <= now:
+            if position + 2 < len(dates) and dates[position + 2] <= now:
+                position = index.asof(self.__date)
+                if self.__profiler is not None:
+                    self.__profiler.count("market.cursor.miss")
+            else:
+                position += 1
+                if self.__profiler is not None:
+                    self.__profiler.count("market.cursor.hit")
+        elif self.__profiler is not None:
+            self.__profiler.count("market.cursor.hit")
+        self.__cursors[key] = position
+        return position
+
+
+    # check if the provider is able to download the data
+    # as a provider may refuse to download old data with small intervals
     def __check_interval_requirements(self, interval, date):
-        delta = self.__get_cur_time_diff(date)
-        if interval == "1m":
-            return delta.days < 30
-        if interval in ["2m", "5m", "15m", "30m", "90m"]:
-            return delta.days < 60
-        if interval in ["60m", "1h"]:
-            return delta.days < 730
-        return True
+        return is_interval_available(self.__provider, interval, date)
 
 
     # get data for the period
@@ -77,81 +305,194 @@ class Market:
         if not self.__check_interval_requirements(interval, start_date):
             raise IntervalError()
 
-        data = get_data(ticker, interval)
+        begin = perf_counter()
+        data = get_data(ticker, interval, self.__provider)
 
         end_date_str = end_date.strftime('%Y-%m-%d')
         start_date_str = start_date.strftime('%Y-%m-%d')
-        return data.loc[start_date_str : end_date_str]
+        data = data.loc[start_date_str : end_date_str]
+        if self.__profiler is not None:
+            self.__profiler.stop("market.get_data", begin)
+        return data
 
 
     def get_stock_data(self, ticker):
-        return yf.Ticker(ticker)
+        return self.__provider.get_stock_data(ticker)
 
 
-    def get_high_day_price(self, ticker, date):
+    # position of the daily bar of the previous business day
+    # or of the day itself if there was no trading on the previous business day
+    def __get_day_bar_position(self, index, date):
         date = datetime(year=date.year, month=date.month, day=date.day)
+        if date > self.__date:
+            raise FuturePeriodError()
         yesterday = date - BDay(1)
-        data = self.get_data(ticker, yesterday, date, "1d")
-        if data.empty:
+        if not self.__check_interval_requirements("1d", yesterday):
+            raise IntervalError()
+        first, last = index.get_range(yesterday, date + timedelta(days=1) - timedelta(microseconds=1))
+        if first == last:
+            return NO_BAR
+        return first
+
+    # Open, High, Low, Close and Volume of the day in one lookup
+    def get_day_bar(self, ticker, date):
+        index = self.__get_index(ticker, "1d")
+        position = self.__get_day_bar_position(index, date)
+        if position == NO_BAR:
             raise EmptyDataError()
-        return data['High'].iloc[0]
+        return index.get_bar(position)
+
+    # (len(tickers), 5) array of Open, High, Low, Close, Volume of the day, nan rows for tickers without data
+    def get_day_bars(self, tickers, date):
+        bars = np.full((len(tickers), len(BAR_COLUMNS)), np.nan)
+        for i, ticker in enumerate(tickers):
+            index = self.__get_index(ticker, "1d")
+            position = self.__get_day_bar_position(index, date)
+            if position != NO_BAR:
+                bars[i] = index.get_bars([position])[0]
+        return bars
+
+    def get_high_day_price(self, ticker, date):
+        return self.get_day_bar(ticker, date).high
 
     def get_low_day_price(self, ticker, date):
-        date = datetime(year=date.year, month=date.month, day=date.day)
-        yesterday = date - BDay(1)
-        data = self.get_data(ticker, yesterday, date, "1d")
-        if data.empty:
-            raise EmptyDataError()
-        return data['Low'].iloc[0]
+        return self.get_day_bar(ticker, date).low
 
     def get_open_day_price(self, ticker, date):
-        date = datetime(year=date.year, month=date.month, day=date.day)
-        yesterday = date - BDay(1)
-        data = self.get_data(ticker, yesterday, date, "1d")
-        if data.empty:
-            raise EmptyDataError()
-        return data['Open'].iloc[0]
+        return self.get_day_bar(ticker, date).open
 
     def get_close_day_price(self, ticker, date):
-        date = datetime(year=date.year, month=date.month, day=date.day)
-        yesterday = date - BDay(1)
-        data = self.get_data(ticker, yesterday, date, "1d")
-        if data.empty:
-            raise EmptyDataError()
-        return data['Open'].iloc[0]
+        return self.get_day_bar(ticker, date).close
+
+
+    # interval of bars that are used to get the price at the date
+    def __get_price_interval(self, date):
+        if date.minute == 30 or not self.__check_interval_requirements("30m", date):
+            interval = "1h"
+        else:
+            interval = "30m"
+
+        if not self.__check_interval_requirements(interval, date):
+            raise IntervalError()
+        return interval
 
 
     # returns the price for the datetime requested
+    # it is the close of the last bar at or before the date,
+    # holiday for example, on 02.04.21 market stopped earlier
     def get_price(self, ticker, date):
+        if date == self.__date:
+            return self.get_current_price(ticker)
         if date > self.__date:
             raise FuturePeriodError()
 
+        if self.__profiler is not None:
+            self.__profiler.count("market.get_price")
         if date.hour < 9: #or (date.hour == 9 and date.minute == 30):  # returns close time of the day
             return self.get_close_day_price(ticker, date)
 
-        delta = self.__get_cur_time_diff(date)
-        if date.minute == 30 or delta.days > 60:
-            interval = "1h"
-        else:
-            interval = "30m"
-
-        if not self.__check_interval_requirements(interval, date):
-            raise IntervalError()
-
-        data = get_data(ticker, interval)
-        if data.empty:
+        index = self.__get_index(ticker, self.__get_price_interval(date))
+        position = index.asof(date)
+        if position == NO_BAR:
             raise EmptyDataError()
+        return index.get_value('Close', position)
 
-        #print(data)
-        if not date in data.index:   # holiday, for example on 02.04.21 market stopped earlier
-            date1 = date
-            while (not date1 in data.index):
-                date1 = date1 - timedelta(hours=0, minutes=30) #BDay(1)
-            return data['Close'].loc[date1]
 
-        return data['Close'].loc[date]
+    # returns prices of the tickers for the datetime requested, nan for tickers without data
+    def get_prices(self, tickers, date):
+        if date > self.__date:
+            raise FuturePeriodError()
 
+        prices = np.full(len(tickers), np.nan)
+        if date.hour < 9:
+            for i, ticker in enumerate(tickers):
+                try:
+                    prices[i] = self.get_close_day_price(ticker, date)
+                except EmptyDataError:
+                    pass
+            return prices
+
+        interval = self.__get_price_interval(date)
+        for i, ticker in enumerate(tickers):
+            index = self.__get_index(ticker, interval)
+            position = index.asof(date)
+            if position != NO_BAR:
+                prices[i] = index.get_value('Close', position)
+        return prices
+
+
+    # returns prices of the ticker for every datetime requested, nan where there is no data
+    def get_price_history(self, ticker, dates):
+        dates = pd.DatetimeIndex(dates)
+        if len(dates) == 0:
+            return np.array([])
+        if dates.max() > self.__date:
+            raise FuturePeriodError()
+
+        prices = np.full(len(dates), np.nan)
+        early = dates.hour < 9
+        for i in np.flatnonzero(early):
+            try:
+                prices[i] = self.get_close_day_price(ticker, dates[i])
+            except EmptyDataError:
+                pass
+
+        # dates are grouped by interval so every group is looked up at once
+        intervals = np.array([None if early[i] else self.__get_price_interval(date) for i, date in enumerate(dates)])
+        for interval in set(intervals[~early]):
+            group = np.flatnonzero(intervals == interval)
+            index = self.__get_index(ticker, interval)
+            prices[group] = index.get_values_asof('Close', dates[group])
+        return prices
+
+
+    # interval of the current prices, checked once per clock move
+    def __get_current_interval(self):
+        if self.__current_interval is None:
+            if self.__price_interval is not None:
+                self.__current_interval = self.__price_interval
+            else:
+                self.__current_interval = self.__get_price_interval(self.__date)
+        return self.__current_interval
+
+    # returns the bar of the interval at the current market date
+    def get_current_bar(self, ticker, interval=None):
+        if interval is None:
+            interval = self.__get_current_interval()
+        index = self.__get_index(ticker, interval)
+        position = self.__get_cursor(ticker, interval, index)
+        if position == NO_BAR:
+            raise EmptyDataError()
+        return index.get_bar(position)
+
+    # start of the bar that get_current_bar returns as int64 nanoseconds
+    def get_current_bar_timestamp(self, ticker, interval=None):
+        if interval is None:
+            interval = self.__get_current_interval()
+        index = self.__get_index(ticker, interval)
+        position = self.__get_cursor(ticker, interval, index)
+        if position == NO_BAR:
+            raise EmptyDataError()
+        return int(index.get_dates()[position])
 
     # returns the price of the current market date
     def get_current_price(self, ticker):
-        return self.get_price(ticker, self.__date)
+        price = self.__current_prices.get(ticker)
+        if price is not None:
+            if self.__profiler is not None:
+                self.__profiler.count("market.current_price.hit")
+            return price
+        if self.__profiler is not None:
+            self.__profiler.count("market.current_price.miss")
+
+        if self.__date.hour < 9 and self.__price_interval is None:
+            price = self.get_close_day_price(ticker, self.__date)
+        else:
+            interval = self.__get_current_interval()
+            index = self.__get_index(ticker, interval)
+            position = self.__get_cursor(ticker, interval, index)
+            if position == NO_BAR:
+                raise EmptyDataError()
+            price = index.get_value('Close', position)
+        self.__current_prices[ticker] = price
+        return price
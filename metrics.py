@@ -0,0 +1,176 @@
+import math
+import numpy as np
+import pandas as pd
+from bar_index import to_timestamp, DAY_NS
+from ledger import GrowingArray, BUY
+
+
+TRADING_DAYS = 252
+
+
+# portfolio cost, free money and value of owned stocks at every tick kept in preallocated arrays
+# running statistics are updated in O(1) per tick: Welford mean and variance of tick returns,
+# sum of squares of negative returns for Sortino ratio, the peak and the drawdown from it
+class EquityCurve:
+    def __init__(self):
+        self.__dates = GrowingArray(np.int64)
+        self.__equity = GrowingArray(np.float64)
+        self.__cash = GrowingArray(np.float64)
+        self.__exposure = GrowingArray(np.float64)
+        self.__returns = 0        # number of tick returns
+        self.__mean = 0.0
+        self.__m2 = 0.0
+        self.__downside = 0.0
+        self.__exposure_sum = 0.0     # sum of exposure / equity
+        self.__peak = None
+        self.__drawdown = 0.0
+        self.__max_drawdown = 0.0
+        self.__days = 0
+        self.__last_day = None
+
+    def __len__(self):
+        return len(self.__equity)
+
+    # room for n more ticks, run knows the number of its ticks in advance
+    def reserve(self, n):
+        for array in (self.__dates, self.__equity, self.__cash, self.__exposure):
+            array.reserve(len(array) + n)
+
+    # free money and value of owned stocks at the date
+    def add(self, date, cash, value):
+        equity = cash + value
+        if len(self.__equity) > 0:
+            previous = self.__equity.get_values()[-1]
+            if previous != 0:
+                r = equity / previous - 1
+                self.__returns += 1
+                delta = r - self.__mean
+                self.__mean += delta / self.__returns
+                self.__m2 += delta * (r - self.__mean)
+                if r < 0:
+                    self.__downside += r * r
+
+        timestamp = to_timestamp(date)
+        day = timestamp // DAY_NS
+        if day != self.__last_day:
+            self.__days += 1
+            self.__last_day = day
+        if self.__peak is None or equity > self.__peak:
+            self.__peak = equity
+        self.__drawdown = (self.__peak - equity) / self.__peak if self.__peak > 0 else 0.0
+        self.__max_drawdown = max(self.__max_drawdown, self.__drawdown)
+        if equity != 0:
+            self.__exposure_sum += value / equity
+
+        self.__dates.append(timestamp)
+        self.__equity.append(equity)
+        self.__cash.append(cash)
+        self.__exposure.append(value)
+
+    # views of the series, no copying
+    def get_timestamps(self):
+        return self.__dates.get_values()
+    def get_dates(self):
+        return pd.DatetimeIndex(self.__dates.get_values().astype("datetime64[ns]"))
+    def get_equity(self):
+        return self.__equity.get_values()
+    def get_cash(self):
+        return self.__cash.get_values()
+    # value of owned stocks, comission of selling them is taken into account
+    def get_exposure(self):
+        return self.__exposure.get_values()
+
+    def get_mean_return(self):
+        return self.__mean if self.__returns > 0 else np.nan
+    def get_volatility(self):
+        return math.sqrt(self.__m2 / (self.__returns - 1)) if self.__returns > 1 else np.nan
+    def get_peak(self):
+        return self.__peak
+    def get_drawdown(self):
+        return self.__drawdown
+    def get_max_drawdown(self):
+        return self.__max_drawdown
+
+    # ticks of a year estimated from the ticks per recorded day
+    def get_ticks_per_year(self):
+        return len(self.__equity) / self.__days * TRADING_DAYS if self.__days > 0 else np.nan
+
+    # {"start_equity", "final_equity", "total_return", "annual_return", "volatility", "sharpe", "sortino",
+    #  "max_drawdown", "exposure", "ticks", "days"}: volatility and ratios are annualized, no risk free rate,
+    # exposure is the average part of the portfolio cost in stocks. Taken from the running statistics
+    def get_metrics(self):
+        n = len(self.__equity)
+        metrics = {"start_equity": np.nan, "final_equity": np.nan, "total_return": np.nan, "annual_return": np.nan,
+                   "volatility": np.nan, "sharpe": np.nan, "sortino": np.nan, "max_drawdown": self.__max_drawdown,
+                   "exposure": self.__exposure_sum / n if n > 0 else np.nan, "ticks": n, "days": self.__days}
+        if n == 0:
+            return metrics
+        equity = self.__equity.get_values()
+        metrics["start_equity"] = float(equity[0])
+        metrics["final_equity"] = float(equity[-1])
+        if equity[0] > 0:
+            metrics["total_return"] = float(equity[-1] / equity[0] - 1)
+            if equity[-1] > 0:
+                metrics["annual_return"] = float((equity[-1] / equity[0]) ** (TRADING_DAYS / self.__days) - 1)
+        scale = math.sqrt(self.get_ticks_per_year())
+        volatility = self.get_volatility()
+        metrics["volatility"] = volatility * scale
+        if volatility > 0:
+            metrics["sharpe"] = self.__mean / volatility * scale
+        if self.__returns > 0 and self.__downside > 0:
+            metrics["sortino"] = self.__mean / math.sqrt(self.__downside / self.__returns) * scale
+        return metrics
+
+    # the same metrics over the last window ticks, computed from the stored series
+    def get_rolling_metrics(self, window):
+        n = len(self.__equity)
+        first = max(0, n - window)
+        equity = self.__equity.get_values()[first:]
+        exposure = self.__exposure.get_values()[first:]
+        metrics = {"start_equity": np.nan, "final_equity": np.nan, "total_return": np.nan, "volatility": np.nan,
+                   "sharpe": np.nan, "sortino": np.nan, "max_drawdown": np.nan, "exposure": np.nan, "ticks": len(equity)}
+        if len(equity) == 0:
+            return metrics
+        metrics["start_equity"] = float(equity[0])
+        metrics["final_equity"] = float(equity[-1])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if equity[0] > 0:
+                metrics["total_return"] = float(equity[-1] / equity[0] - 1)
+            peaks = np.maximum.accumulate(equity)
+            metrics["max_drawdown"] = float(np.where(peaks > 0, (peaks - equity) / peaks, 0).max())
+            metrics["exposure"] = float(np.mean(np.where(equity != 0, exposure / equity, 0)))
+            returns = equity[1:] / equity[:-1] - 1
+        returns = returns[np.isfinite(returns)]
+        scale = math.sqrt(self.get_ticks_per_year())
+        if len(returns) > 1:
+            volatility = returns.std(ddof=1)
+            metrics["volatility"] = float(volatility * scale)
+            if volatility > 0:
+                metrics["sharpe"] = float(returns.mean() / volatility * scale)
+            downside = np.sqrt(np.mean(np.minimum(returns, 0) ** 2))
+            if downside > 0:
+                metrics["sortino"] = float(returns.mean() / downside * scale)
+        return metrics
+
+
+# traded value of the ledger operations divided by the average portfolio cost
+def get_turnover(ledger, curve):
+    if len(curve) == 0 or len(ledger) == 0:
+        return 0.0
+    traded = np.sum(ledger.get_column('quantity') * ledger.get_column('price'))
+    average = curve.get_equity().mean()
+    return float(traded / average) if average > 0 else np.nan
+
+
+# ticker -> profit: sales - purchases - comission + values of owned stocks (ticker -> value)
+def get_ticker_pnl(ledger, values):
+    pnl = {}
+    tickers = np.array(ledger.get_tickers(), dtype=object)
+    if len(ledger) > 0:
+        amounts = ledger.get_column('quantity') * ledger.get_column('price')
+        amounts = np.where(ledger.get_column('side') == BUY, -amounts, amounts) - ledger.get_column('comission')
+        totals = np.bincount(ledger.get_column('ticker_id'), weights=amounts, minlength=len(tickers))
+        pnl = {ticker: float(total) for ticker, total in zip(tickers, totals)}
+    for ticker, value in values.items():
+        pnl[ticker] = pnl.get(ticker, 0.0) + value
+    return pnl
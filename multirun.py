@@ -0,0 +1,50 @@
+import pandas as pd
+from market import Market
+
+
+class MultiRunError(Exception):
+    pass
+
+
+# runs the accounts (AccountSimulator objects of any strategies) from start_date up to end_date with one
+# clock loop: at every tick the shared market is moved once and each account makes its step on it,
+# so bars are loaded and current prices are looked up once per tick for all of them.
+# Every account keeps its own cash, stocks, orders, indicators, journal and history, an EmptyDataError
+# skips the rest of the day of that account only. All accounts must have the same provider and calendar
+# profiled accounts time their own phases, the shared market's lookups (get_price, get_data, bar cursors)
+# are counted once by the profiler of the first profiled account
+# returns a table of get_metrics of the accounts, names label its rows
+def run_accounts(accounts, start_date, end_date, names=None):
+    if len(accounts) == 0:
+        raise MultiRunError("no accounts to run")
+    if names is not None and len(names) != len(accounts):
+        raise MultiRunError("a name is needed for every account")
+    provider = accounts[0].get_provider()
+    calendar = accounts[0].get_calendar()
+    for account in accounts[1:]:
+        if account.get_provider() is not provider:
+            raise MultiRunError("accounts must have the same provider")
+        if account.get_calendar() is not calendar:
+            raise MultiRunError("accounts must have the same calendar")
+
+    shared = Market(start_date, provider)
+    profilers = [account.get_profiler() for account in accounts if account.get_profiler() is not None]
+    if len(profilers) > 0:
+        shared.set_profiler(profilers[0])
+    ticks = calendar.get_ticks(start_date, end_date)
+    for account in accounts:
+        account.begin_run(start_date, end_date, shared)
+        account.get_equity_curve().reserve(len(ticks))
+    try:
+        for date in ticks:
+            shared.advance(date)
+            for account in accounts:
+                account.step(date)
+    finally:
+        for account in accounts:
+            account.end_run()
+
+    table = pd.DataFrame([account.get_metrics() for account in accounts])
+    if names is not None:
+        table.index = list(names)
+    return table
@@ -0,0 +1,159 @@
+import numpy as np
+from bar_index import to_timestamp
+from ledger import ColumnArrays, BUY, SIDES
+
+
+class OrderError(Exception):
+    pass
+
+
+MARKET = 0
+LIMIT = 1
+STOP = 2
+STOP_LIMIT = 3
+TRAILING_STOP = 4
+ORDER_TYPES = ['market', 'limit', 'stop', 'stop_limit', 'trailing_stop']
+
+OPEN = 0
+FILLED = 1
+CANCELLED = 2
+EXPIRED = 3
+REJECTED = 4
+STATUSES = ['open', 'filled', 'cancelled', 'expired', 'rejected']
+
+NO_EXPIRY = np.iinfo(np.int64).max
+NO_SUBMISSION = np.iinfo(np.int64).min   # orders added without a date are checked against any bar
+
+
+# resting orders stored by columns, every tick all open orders are checked against the current bars at once
+# orders are checked from the first bar that starts after their submission, the bar of the submission tick
+# has already given the current price the order was placed at
+# touch detection: buy limits fill when the bar Low reaches the limit, buy stops when the High reaches the stop,
+# sells vice versa. Fills are at the order price or at the bar Open if the bar opened beyond it.
+# trailing stops follow the highest High (sells) or the lowest Low (buys) seen since submission
+class OrderBook:
+    COLUMNS = ['ticker_id', 'side', 'type', 'quantity', 'limit', 'stop', 'trail', 'reference', 'expiry', 'submitted', 'status', 'triggered']
+    DTYPES = [np.int32, np.int8, np.int8, np.int64, np.float64, np.float64, np.float64, np.float64, np.int64, np.int64, np.int8, np.bool_]
+
+    def __init__(self, capacity=256):
+        self.__columns = ColumnArrays(self.COLUMNS, self.DTYPES, capacity)
+        self.__open = np.array([], dtype=np.int64)   # ids of open orders in submission order
+        self.__added = []                            # ids of orders added since the open ids were updated
+
+    def __len__(self):
+        return len(self.__columns)
+
+    def get_tickers(self):
+        return self.__columns.get_tickers()
+
+    # view of a column, no copying
+    def get_column(self, name):
+        return self.__columns.get_column(name)
+
+    # reference: the current price for trailing stops, submitted: the submission date
+    # returns the order id
+    def add(self, ticker, side, order_type, quantity, limit=np.nan, stop=np.nan, trail=np.nan, reference=np.nan, expiry=None,
+            submitted=None):
+        values = [self.__columns.add_ticker(ticker), side, order_type, quantity, limit, stop, trail, reference,
+                  NO_EXPIRY if expiry is None else to_timestamp(expiry),
+                  NO_SUBMISSION if submitted is None else to_timestamp(submitted), OPEN, False]
+        order_id = self.__columns.append(values)
+        self.__added.append(order_id)
+        return order_id
+
+    def __get_open(self):
+        if len(self.__added) > 0:
+            self.__open = np.append(self.__open, self.__added)
+            self.__added = []
+        return self.__open
+
+    def __close(self, order_ids, status):
+        self.get_column('status')[order_ids] = status
+        open_ids = self.__get_open()
+        self.__open = open_ids[self.get_column('status')[open_ids] == OPEN]
+
+    def set_status(self, order_id, status):
+        if self.get_column('status')[order_id] != OPEN:
+            raise OrderError(f"order {order_id} is {STATUSES[self.get_column('status')[order_id]]}")
+        self.__close([order_id], status)
+
+    def cancel(self, order_id):
+        if order_id < 0 or order_id >= len(self):
+            raise OrderError(f"no order {order_id}")
+        self.set_status(order_id, CANCELLED)
+
+    def get_open_ids(self, ticker=None):
+        open_ids = self.__get_open()
+        if ticker is None:
+            return open_ids
+        ticker_id = self.__columns.get_ticker_id(ticker)
+        return open_ids[self.get_column('ticker_id')[open_ids] == (-1 if ticker_id is None else ticker_id)]
+
+    # {"id", "ticker", "side", "type", "quantity", "limit", "stop", "trail", "expiry", "submitted", "status"}
+    def get_order(self, order_id):
+        if order_id < 0 or order_id >= len(self):
+            raise OrderError(f"no order {order_id}")
+        columns = self.__columns
+        expiry = columns['expiry'][order_id]
+        submitted = columns['submitted'][order_id]
+        return {"id": order_id, "ticker": self.get_tickers()[columns['ticker_id'][order_id]],
+                "side": SIDES[columns['side'][order_id]], "type": ORDER_TYPES[columns['type'][order_id]],
+                "quantity": int(columns['quantity'][order_id]), "limit": float(columns['limit'][order_id]),
+                "stop": float(columns['stop'][order_id]), "trail": float(columns['trail'][order_id]),
+                "expiry": None if expiry == NO_EXPIRY else np.datetime64(int(expiry), "ns").astype("datetime64[us]").item(),
+                "submitted": None if submitted == NO_SUBMISSION else np.datetime64(int(submitted), "ns").astype("datetime64[us]").item(),
+                "status": STATUSES[columns['status'][order_id]]}
+
+    # expires old orders and checks the open ones against the bars of their tickers
+    # get_bar(ticker) returns ((open, high, low, close, volume), start timestamp) of the current bar,
+    # nan values if there is none; orders submitted at or after the bar start are not checked against it
+    # returns (order ids, fill prices) of the orders to fill in submission order, they stay open until set_status
+    def evaluate(self, date, get_bar):
+        open_ids = self.__get_open()
+        expired = open_ids[self.get_column('expiry')[open_ids] <= to_timestamp(date)]
+        if len(expired) > 0:
+            self.__close(expired, EXPIRED)
+        ids = self.__open
+        if len(ids) == 0:
+            return ids, np.array([])
+
+        columns = self.__columns
+        ticker_ids, positions = np.unique(columns['ticker_id'][ids], return_inverse=True)
+        bars = [get_bar(self.get_tickers()[ticker_id]) for ticker_id in ticker_ids]
+        starts = np.array([start for _, start in bars], dtype=np.int64)[positions]
+        started = columns['submitted'][ids] < starts
+        ids, positions = ids[started], positions[started]
+        if len(ids) == 0:
+            return ids, np.array([])
+        bars = np.array([bar for bar, _ in bars], dtype=np.float64)
+        opens, highs, lows = bars[positions, 0], bars[positions, 1], bars[positions, 2]
+
+        buy = columns['side'][ids] == BUY
+        order_type = columns['type'][ids]
+        limit = columns['limit'][ids]
+        trailing = order_type == TRAILING_STOP
+        reference = columns['reference'][ids]
+        trail = columns['trail'][ids]
+        stop = np.where(trailing, np.where(buy, reference + trail, reference - trail), columns['stop'][ids])
+
+        with np.errstate(invalid="ignore"):
+            stops = (order_type == STOP) | (order_type == STOP_LIMIT) | trailing
+            stop_hit = stops & ~columns['triggered'][ids] & np.where(buy, highs >= stop, lows <= stop)
+            stop_price = np.where(buy, np.maximum(stop, opens), np.minimum(stop, opens))
+
+            # a stop limit becomes a limit order when its stop is reached
+            limits = (order_type == LIMIT) | ((order_type == STOP_LIMIT) & (columns['triggered'][ids] | stop_hit))
+            limit_hit = limits & np.where(buy, lows <= limit, highs >= limit)
+            start_price = np.where((order_type == STOP_LIMIT) & stop_hit, stop_price, opens)
+            limit_price = np.where(buy, np.minimum(limit, start_price), np.maximum(limit, start_price))
+
+        filled = (stop_hit & (order_type != STOP_LIMIT)) | limit_hit
+        prices = np.where(limits, limit_price, stop_price)
+
+        triggered = ids[stop_hit & (order_type == STOP_LIMIT) & ~limit_hit]
+        columns['triggered'][triggered] = True
+        # trailing stops that are still open follow the bar
+        moving = trailing & ~filled
+        columns['reference'][ids[moving]] = np.where(buy[moving], np.fmin(reference[moving], lows[moving]),
+                                                     np.fmax(reference[moving], highs[moving]))
+        return ids[filled], prices[filled]
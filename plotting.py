@@ -0,0 +1,88 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from market import get_bar_index
+from ledger import BUY, SELL
+
+
+# largest triangle three buckets downsampling: keeps the first and the last points and
+# a point of every bucket in between that forms the largest triangle with its neighbours
+# returns indices of the points to keep
+def lttb(x, y, n_out):
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)   # n_out - 2 buckets between the first and the last point
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    previous = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        # the average point of the next bucket is the third vertex
+        next_start, next_end = end, (edges[i + 2] if i + 2 < len(edges) else n)
+        next_x = x[next_start:next_end].mean()
+        next_y = y[next_start:next_end].mean()
+        areas = np.abs((x[previous] - next_x) * (y[start:end] - y[previous])
+                       - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        selected[i + 1] = previous
+    return selected
+
+
+# draws the price line and buy (green) and sell (red) points into a png file
+# dates are int64 nanoseconds
+def render_ticker_plot(path, title, dates, prices, buy_dates, buy_prices, sell_dates, sell_prices):
+    figure = Figure(figsize=(10, 5))
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot()
+    axes.plot(np.asarray(dates).astype("datetime64[ns]"), prices)
+    axes.scatter(np.asarray(buy_dates).astype("datetime64[ns]"), buy_prices, color='green')
+    axes.scatter(np.asarray(sell_dates).astype("datetime64[ns]"), sell_prices, color='red')
+    axes.set_title(title)
+    figure.autofmt_xdate()
+    figure.savefig(path)
+    return path
+
+def _render_job(job):
+    return render_ticker_plot(*job)
+
+
+# renders history plots of every traded ticker of a finished run into directory
+# price series are taken from the already loaded bars and downsampled to max_points before drawing,
+# tickers are drawn in parallel by processes workers (1 - in the current process)
+def render_history(simulator, directory=".", processes=None, max_points=2000, interval="1h"):
+    start_date = simulator.get_start_date()
+    end_date = simulator.get_end_date()
+    ledger = simulator.get_ledger()
+    if len(ledger) == 0 or start_date is None or end_date is None:
+        return []
+
+    os.makedirs(directory, exist_ok=True)
+    ledger_dates = ledger.get_column('date')
+    ledger_prices = ledger.get_column('price')
+    jobs = []
+    for ticker in ledger.get_tickers():
+        index = get_bar_index(ticker, interval, simulator.get_provider())
+        first, last = index.get_range(start_date, end_date)
+        dates = index.get_dates()[first:last]
+        prices = index.get_column('Close')[first:last]
+        kept = lttb(dates, prices, max_points)
+
+        buy_rows = ledger.get_rows(ticker, BUY)
+        sell_rows = ledger.get_rows(ticker, SELL)
+
+        title = f"{ticker} history: {start_date.strftime('%d.%m.%Y')} - {end_date.strftime('%d.%m.%Y')}"
+        png_name = f"{ticker}_{start_date.strftime('%d-%m-%Y')}_{end_date.strftime('%d-%m-%Y')}.png"
+        jobs.append((os.path.join(directory, png_name), title, np.array(dates[kept]), np.array(prices[kept]),
+                     ledger_dates[buy_rows], ledger_prices[buy_rows], ledger_dates[sell_rows], ledger_prices[sell_rows]))
+
+    if processes == 1 or len(jobs) == 1:
+        return [_render_job(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(_render_job, jobs, chunksize=max(1, len(jobs) // (4 * (processes or os.cpu_count() or 1)))))
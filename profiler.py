@@ -0,0 +1,69 @@
+import sys
+import json
+from time import perf_counter
+
+
+# timers and counters of a run, disabled unless it is given to AccountSimulator.enable_profiling
+# timers: name -> total seconds and number of calls
+# counters: name -> number, "<name>.hit" and "<name>.miss" pairs give "<name>.hit_rate" in the summary
+class Profiler:
+    def __init__(self):
+        self.__timers = {}     # name -> [seconds, calls]
+        self.__counters = {}
+
+    def reset(self):
+        self.__timers = {}
+        self.__counters = {}
+
+    # begin = perf_counter() before the timed code
+    def stop(self, name, begin):
+        self.add_time(name, perf_counter() - begin)
+
+    def add_time(self, name, seconds, calls=1):
+        timer = self.__timers.get(name)
+        if timer is None:
+            self.__timers[name] = [seconds, calls]
+        else:
+            timer[0] += seconds
+            timer[1] += calls
+
+    def count(self, name, n=1):
+        self.__counters[name] = self.__counters.get(name, 0) + n
+
+    def get_timers(self):
+        return {name: (seconds, calls) for name, (seconds, calls) in self.__timers.items()}
+
+    def get_counters(self):
+        return dict(self.__counters)
+
+    # flat {name: value} of all timers, counters and hit rates
+    def get_summary(self):
+        summary = {}
+        for name, (seconds, calls) in sorted(self.__timers.items()):
+            summary[f"{name}.seconds"] = seconds
+            summary[f"{name}.calls"] = calls
+        for name, n in sorted(self.__counters.items()):
+            summary[name] = n
+            if name.endswith(".hit"):
+                prefix = name[:-len(".hit")]
+                total = n + self.__counters.get(prefix + ".miss", 0)
+                summary[prefix + ".hit_rate"] = n / total if total > 0 else None
+        return summary
+
+    def export_json(self, path):
+        with open(path, "w") as file:
+            json.dump(self.get_summary(), file, indent=1)
+
+    def print_summary(self, file=sys.stdout):
+        for name, (seconds, calls) in sorted(self.__timers.items(), key=lambda item: -item[1][0]):
+            file.write(f"{name:32} {seconds:10.4f} s {calls:10} calls\n")
+        for name, value in self.get_summary().items():
+            if name in self.__counters or name.endswith(".hit_rate"):
+                file.write(f"{name:32} {value if value is not None else '-'}\n")
+
+
+# hits and misses of lru caches since the infos were taken: {name: cache_info()}
+def count_cache_infos(profiler, before, after):
+    for name in after:
+        profiler.count(name + ".hit", after[name].hits - before[name].hits)
+        profiler.count(name + ".miss", after[name].misses - before[name].misses)
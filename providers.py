@@ -0,0 +1,367 @@
+import os
+import zlib
+from functools import lru_cache
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import yfinance as yf
+from bar_store import BarStore
+from bar_index import BarIndex, BAR_COLUMNS, DAY_NS
+from trading_calendar import SESSION_OPEN_MINUTES, SESSION_MINUTES
+
+
+class ProviderError(Exception):
+    pass
+
+class UnsupportedIntervalError(ProviderError):
+    pass
+
+
+DAY_INTERVALS = ["1d", "5d", "1wk", "1mo", "3mo"]
+INTRADAY_MINUTES = {"1m": 1, "2m": 2, "5m": 5, "15m": 15, "30m": 30, "60m": 60, "90m": 90, "1h": 60}
+
+
+def empty_frame():
+    return pd.DataFrame(columns=BAR_COLUMNS, index=pd.DatetimeIndex([], name="Date"), dtype=float)
+
+
+MINUTE_NS = 60 * 10 ** 9
+
+# interval that bars of interval are aggregated from when the finest bars are pyramid_interval ones,
+# None if the interval is downloaded as it is
+def get_pyramid_base(pyramid_interval, interval):
+    if pyramid_interval is None or interval == pyramid_interval:
+        return None
+    if interval == "1d":
+        return pyramid_interval
+    if interval in INTRADAY_MINUTES:
+        minutes, base_minutes = INTRADAY_MINUTES[interval], INTRADAY_MINUTES[pyramid_interval]
+        if minutes > base_minutes and minutes % base_minutes == 0:
+            return pyramid_interval
+    return None
+
+# aggregates intraday bars into bars of a coarser interval: first Open, max High, min Low, last Close, sum of Volume
+# intraday bars start at 9:30 of every session and every interval after it, the last one of a session may be shorter,
+# daily bars are labeled with the date
+def resample(data, interval):
+    if interval != "1d" and not interval in INTRADAY_MINUTES:
+        raise UnsupportedIntervalError(interval)
+    data = data.dropna(subset=["Close"])
+    if data.empty:
+        return empty_frame()
+
+    index = BarIndex.from_frame(data)
+    stamps = index.get_dates()
+    days = stamps - stamps % DAY_NS
+    if interval == "1d":
+        labels = days
+    else:
+        step = INTRADAY_MINUTES[interval] * MINUTE_NS
+        opening = days + SESSION_OPEN_MINUTES * MINUTE_NS
+        labels = opening + (stamps - opening) // step * step
+
+    starts = np.flatnonzero(np.diff(labels, prepend=labels[0] - 1) != 0)
+    ends = np.append(starts[1:], len(labels)) - 1
+    aggregated = {
+        "Open": index.get_column("Open")[starts],
+        "High": np.maximum.reduceat(index.get_column("High"), starts),
+        "Low": np.minimum.reduceat(index.get_column("Low"), starts),
+        "Close": index.get_column("Close")[ends],
+        "Volume": np.add.reduceat(index.get_column("Volume"), starts),
+    }
+    name = "Date" if interval == "1d" else "Datetime"
+    return pd.DataFrame(aggregated, index=pd.DatetimeIndex(labels[starts].astype("datetime64[ns]"), name=name), columns=BAR_COLUMNS)
+
+
+# source of bars for the market
+# download returns a frame with Open, High, Low, Close, Volume columns
+# indexed by exchange local time without timezone
+class DataProvider:
+    def get_name(self):
+        return type(self).__name__
+
+    # remote providers use network, their bars are kept in the bar store
+    def is_remote(self):
+        return False
+
+    # how old the data of the interval can be (timedelta) or None if there is no limit
+    def get_history_limit(self, interval):
+        return None
+
+    # finer interval that the market aggregates bars of interval from, see resample
+    # None if the interval is downloaded as it is
+    def get_base_interval(self, interval):
+        return None
+
+    # bars starting from start_period or all bars available if start_period is None
+    def download(self, ticker, interval, start_period=None):
+        raise NotImplementedError()
+
+    # providers that keep bars as arrays may return a BarIndex over them without building a frame
+    def get_bar_index(self, ticker, interval):
+        return None
+
+    def get_stock_data(self, ticker):
+        raise NotImplementedError()
+
+
+# pyramid_interval: intraday interval downloaded once per ticker, coarser intraday intervals are built from it.
+# Daily bars are always downloaded as yfinance keeps much longer daily history than intraday one
+class YahooProvider(DataProvider):
+    def __init__(self, pyramid_interval=None):
+        self.__pyramid_interval = pyramid_interval
+
+    def is_remote(self):
+        return True
+
+    def get_base_interval(self, interval):
+        if interval in DAY_INTERVALS:
+            return None
+        return get_pyramid_base(self.__pyramid_interval, interval)
+
+    # yfinance refuses to download old data with small intervals
+    def get_history_limit(self, interval):
+        base = self.get_base_interval(interval)
+        if base is not None:
+            interval = base
+        if interval == "1m":
+            return timedelta(days=30)
+        if interval in ["2m", "5m", "15m", "30m", "90m"]:
+            return timedelta(days=60)
+        if interval in ["60m", "1h"]:
+            return timedelta(days=730)
+        return None
+
+    # yfinance returns a column per (price type, ticker) and an exchange timezone aware index
+    # simulator works with exchange local time without timezone
+    def __normalize(self, data):
+        if data is None:
+            return empty_frame()
+        if isinstance(data.columns, pd.MultiIndex):
+            data = data.droplevel(1, axis=1)
+        if data.index.tz is not None:
+            data = data.tz_convert("America/New_York").tz_localize(None)
+        return data
+
+    # Ticker.history keeps no state shared between downloads, so tickers can be downloaded by several threads
+    # errors are raised instead of returning an empty frame
+    def __download(self, ticker, interval, **period):
+        data = yf.Ticker(ticker).history(interval=interval, actions=False, raise_errors=True, **period)
+        data = self.__normalize(data)
+        return empty_frame() if data.empty else data[BAR_COLUMNS]
+
+    def download(self, ticker, interval, start_period=None):
+        if interval in DAY_INTERVALS:
+            if start_period is None:
+                return self.__download(ticker, interval, period="max")
+            return self.__download(ticker, interval, start=start_period)
+
+        if interval == "1m":
+            delta = timedelta(days=7)
+        elif interval in ["2m", "5m", "15m", "30m", "90m"]:
+            delta = timedelta(days=59)
+        else:          # interval in ["60m", "1h"]
+            delta = timedelta(days=729)
+
+        # older data can not be downloaded for small intervals anyway
+        first_available = datetime.now() - delta
+        if start_period is None or start_period < first_available:
+            start_period = first_available
+        return self.__download(ticker, interval, start=start_period)
+
+    def get_stock_data(self, ticker):
+        return yf.Ticker(ticker)
+
+
+# reads bars from local files: <root>/<interval>/<ticker>.npz (bar store format) or <root>/<interval>/<ticker>.csv
+# pyramid_interval: the only intraday interval kept in files, coarser and daily bars are built from it
+class LocalFileProvider(DataProvider):
+    def __init__(self, root, pyramid_interval=None):
+        self.__root = root
+        self.__store = BarStore(root)
+        self.__pyramid_interval = pyramid_interval
+
+    def get_root(self):
+        return self.__root
+
+    def get_base_interval(self, interval):
+        return get_pyramid_base(self.__pyramid_interval, interval)
+
+    def download(self, ticker, interval, start_period=None):
+        data = self.__store.load(ticker, interval)
+        if data is None:
+            csv_path = os.path.join(self.__root, interval, ticker + ".csv")
+            if not os.path.exists(csv_path):
+                return empty_frame()
+            data = pd.read_csv(csv_path, index_col=0, parse_dates=True)
+        if start_period is not None:
+            data = data.loc[start_period:]
+        return data
+
+
+# reads memory mapped bars: <root>/<interval>/<ticker>/<column>.npy with an index.npy of int64 timestamps
+# processes that read the same files share the memory
+class MemmapProvider(DataProvider):
+    def __init__(self, root):
+        self.__root = root
+
+    def get_root(self):
+        return self.__root
+
+    def __get_directory(self, ticker, interval):
+        return os.path.join(self.__root, interval, ticker)
+
+    def get_bar_index(self, ticker, interval):
+        directory = self.__get_directory(ticker, interval)
+        if not os.path.exists(directory):
+            return BarIndex(np.array([], dtype=np.int64), {})
+        dates = np.load(os.path.join(directory, "index.npy"), mmap_mode="r")
+        columns = {}
+        for column in BAR_COLUMNS:
+            path = os.path.join(directory, column + ".npy")
+            if os.path.exists(path):
+                columns[column] = np.load(path, mmap_mode="r")
+        return BarIndex(dates, columns)
+
+    def download(self, ticker, interval, start_period=None):
+        index = self.get_bar_index(ticker, interval)
+        if len(index) == 0:
+            return empty_frame()
+        dates = pd.DatetimeIndex(np.asarray(index.get_dates()).astype("datetime64[ns]"), name="Date")
+        data = pd.DataFrame({column: index.get_column(column) for column in BAR_COLUMNS}, index=dates)
+        if start_period is not None:
+            data = data.loc[start_period:]
+        return data
+
+    # writes bars in the format the provider reads
+    @staticmethod
+    def save(root, ticker, interval, data):
+        directory = os.path.join(root, interval, ticker)
+        os.makedirs(directory, exist_ok=True)
+        index = BarIndex.from_frame(data)
+        np.save(os.path.join(directory, "index.npy"), index.get_dates())
+        for column in BAR_COLUMNS:
+            np.save(os.path.join(directory, column + ".npy"), index.get_column(column))
+
+
+# deterministic synthetic market: geometric brownian motion with jumps
+# the same (seed, ticker) always produces the same bars
+# a single path of base_interval bars is generated for 9:30 - 16:00 sessions of business days between start and end,
+# bars of coarser intervals are aggregated from it so all intervals are consistent
+# pyramid_interval: the market requests only bars of this interval and aggregates coarser ones itself,
+# so the path is generated once per ticker instead of once per interval
+class SyntheticProvider(DataProvider):
+    DAYS_PER_YEAR = 252
+
+    def __init__(self, seed=0, start=datetime(2015, 1, 1), end=datetime(2025, 1, 1), base_interval="1m",
+                 jump_intensity=4.0, jump_mean=-0.01, jump_std=0.05, pyramid_interval=None):
+        if not base_interval in INTRADAY_MINUTES or SESSION_MINUTES % INTRADAY_MINUTES[base_interval] != 0:
+            raise UnsupportedIntervalError(base_interval)
+        self.__seed = seed
+        self.__start = start
+        self.__end = end
+        self.__base_minutes = INTRADAY_MINUTES[base_interval]
+        self.__jump_intensity = jump_intensity  # expected number of jumps per year
+        self.__jump_mean = jump_mean            # mean log size of a jump
+        self.__jump_std = jump_std
+        self.__pyramid_interval = pyramid_interval
+
+    def get_name(self):
+        return f"SyntheticProvider_{self.__seed}"
+
+    def get_base_interval(self, interval):
+        return get_pyramid_base(self.__pyramid_interval, interval)
+
+    # ticker parameters: annual drift and volatility, the first price and average daily volume
+    def get_parameters(self, ticker):
+        rng = np.random.default_rng([self.__seed, zlib.crc32(ticker.encode())])
+        drift = rng.uniform(-0.05, 0.15)
+        volatility = rng.uniform(0.15, 0.6)
+        start_price = rng.uniform(10, 500)
+        volume = rng.uniform(1e5, 1e7)
+        return drift, volatility, start_price, volume
+
+    # returns trading days and (days x bars per session) arrays of base bars, the last paths are cached
+    # so every interval of a ticker is aggregated from one generated path
+    def __generate_base(self, ticker):
+        return _generate_synthetic_base(self.__seed, self.__start, self.__end, self.__base_minutes, self.__jump_intensity,
+                                        self.__jump_mean, self.__jump_std, ticker, self.get_parameters(ticker))
+
+    def download(self, ticker, interval, start_period=None):
+        if interval == "1d":
+            minutes = SESSION_MINUTES
+        elif interval in INTRADAY_MINUTES and INTRADAY_MINUTES[interval] % self.__base_minutes == 0:
+            minutes = INTRADAY_MINUTES[interval]
+        else:
+            raise UnsupportedIntervalError(interval)
+
+        days, (opens, highs, lows, closes, volumes) = self.__generate_base(ticker)
+        if len(days) == 0:
+            return empty_frame()
+
+        # bars of the interval start every step base bars, the last bar of a session may be shorter
+        step = minutes // self.__base_minutes
+        starts = np.arange(0, opens.shape[1], step)
+        ends = np.append(starts[1:], opens.shape[1]) - 1
+        data = {
+            "Open": opens[:, starts].ravel(),
+            "High": np.maximum.reduceat(highs, starts, axis=1).ravel(),
+            "Low": np.minimum.reduceat(lows, starts, axis=1).ravel(),
+            "Close": closes[:, ends].ravel(),
+            "Volume": np.add.reduceat(volumes, starts, axis=1).ravel(),
+        }
+
+        if interval == "1d":
+            index = pd.DatetimeIndex(days.values.astype("datetime64[ns]"), name="Date")
+        else:
+            opening = days.values.astype("datetime64[m]") + np.timedelta64(SESSION_OPEN_MINUTES, "m")
+            offsets = (starts * self.__base_minutes).astype("timedelta64[m]")
+            stamps = (opening[:, None] + offsets[None, :]).ravel()
+            index = pd.DatetimeIndex(stamps.astype("datetime64[ns]"), name="Datetime")
+
+        data = pd.DataFrame(data, index=index, columns=BAR_COLUMNS)
+        if start_period is not None:
+            data = data.loc[start_period:]
+        return data
+
+    def get_stock_data(self, ticker):
+        drift, volatility, start_price, volume = self.get_parameters(ticker)
+        return {"symbol": ticker, "drift": drift, "volatility": volatility,
+                "startPrice": start_price, "averageVolume": volume}
+
+
+# base bars of a SyntheticProvider path, see SyntheticProvider.get_parameters for parameters
+# a path of 1m bars over ten years takes tens of megabytes, so only a few recent ones are kept
+@lru_cache(maxsize=8)
+def _generate_synthetic_base(seed, start, end, base_minutes, jump_intensity, jump_mean, jump_std, ticker, parameters):
+    days = pd.bdate_range(start, end)
+    bars_per_day = SESSION_MINUTES // base_minutes
+    shape = (len(days), bars_per_day)
+    n = shape[0] * shape[1]
+
+    drift, volatility, start_price, volume = parameters
+    rng = np.random.default_rng([seed, zlib.crc32(ticker.encode()), 1])
+    dt = 1 / (SyntheticProvider.DAYS_PER_YEAR * bars_per_day)
+
+    returns = (drift - 0.5 * volatility ** 2) * dt + volatility * np.sqrt(dt) * rng.standard_normal(n)
+    jumps = rng.poisson(jump_intensity * dt, n)
+    returns += jumps * jump_mean + np.sqrt(jumps) * jump_std * rng.standard_normal(n)
+    # overnight gap before the first bar of every session
+    gaps = np.zeros(shape)
+    gaps[:, 0] = volatility * np.sqrt(dt) * 2 * rng.standard_normal(shape[0])
+    gaps = gaps.ravel()
+
+    closes = start_price * np.exp(np.cumsum(returns + gaps))
+    opens = np.empty(n)
+    opens[0] = start_price * np.exp(gaps[0])
+    opens[1:] = closes[:-1] * np.exp(gaps[1:])
+    # bars move inside the range between open and close and a bit further
+    spread = volatility * np.sqrt(dt) * np.abs(rng.standard_normal((2, n))) * 0.5
+    highs = np.maximum(opens, closes) * np.exp(spread[0])
+    lows = np.minimum(opens, closes) * np.exp(-spread[1])
+    volumes = np.round(volume / bars_per_day * rng.lognormal(0, 0.5, n))
+
+    arrays = [array.reshape(shape) for array in (opens, highs, lows, closes, volumes)]
+    for array in arrays:
+        array.flags.writeable = False   # shared by the intervals of the cached path
+    return days, arrays
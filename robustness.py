@@ -0,0 +1,396 @@
+import sys
+import copy
+import time
+import traceback
+from functools import reduce
+import numpy as np
+import pandas as pd
+from market import get_bar_index
+from bar_index import to_timestamp, DAY_NS, BAR_COLUMNS
+from providers import DataProvider, UnsupportedIntervalError, INTRADAY_MINUTES, get_pyramid_base
+from sweep import run_pool, init_worker
+from ledger import ALL
+
+
+class RobustnessError(Exception):
+    pass
+
+
+RESULT_COLUMNS = ["final_equity", "max_drawdown", "trades"]
+
+
+# (paths x length) positions of days drawn in blocks of consecutive days, the history wraps around at its end
+def block_positions(n_days, n_paths, length, block, rng):
+    if n_days == 0:
+        raise RobustnessError("no days to bootstrap")
+    block = max(1, min(block, n_days))
+    n_blocks = -(-length // block)
+    starts = rng.integers(0, n_days, (n_paths, n_blocks))
+    positions = (starts[:, :, None] + np.arange(block)) % n_days
+    return positions.reshape(n_paths, -1)[:, :length]
+
+
+# the largest fall from a peak as a fraction of the peak along the last axis
+def max_drawdown(equity):
+    equity = np.asarray(equity, dtype=np.float64)
+    if equity.shape[-1] == 0:
+        return np.zeros(equity.shape[:-1])
+    peaks = np.maximum.accumulate(equity, axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        drawdowns = np.where(peaks > 0, (peaks - equity) / peaks, 0.0)
+    return drawdowns.max(axis=-1)
+
+
+# daily bars of the tickers between the dates on the days all of them were traded
+# returns (days, (days x 4 x tickers) Open, High, Low, Close)
+def get_day_bar_matrix(tickers, start_date=None, end_date=None, provider=None):
+    indices = [get_bar_index(ticker, "1d", provider) for ticker in tickers]
+    days = [index.get_dates() - index.get_dates() % DAY_NS for index in indices]
+    common = reduce(np.intersect1d, days)
+    if start_date is not None:
+        common = common[common >= to_timestamp(start_date)]
+    if end_date is not None:
+        common = common[common <= to_timestamp(end_date)]
+
+    bars = np.empty((len(common), 4, len(tickers)))
+    for j, (index, ticker_days) in enumerate(zip(indices, days)):
+        positions = np.searchsorted(ticker_days, common)
+        for k, column in enumerate(["Open", "High", "Low", "Close"]):
+            bars[:, k, j] = np.asarray(index.get_column(column))[positions]
+    keep = ~np.isnan(bars).any(axis=(1, 2))
+    return common[keep], bars[keep]
+
+
+# a day of every ticker is described by logs of Close / previous Close and of Open, High, Low / Close
+# returns (days - 1 x tickers) close returns and (days - 1 x 3 x tickers) shapes of the days after the first one
+def _split_days(bars):
+    bars = np.asarray(bars, dtype=np.float64)
+    if len(bars) < 2:
+        raise RobustnessError("at least two days are needed")
+    logs = np.log(bars)
+    returns = logs[1:, 3] - logs[:-1, 3]
+    shapes = logs[1:, :3] - logs[1:, 3:4]
+    return returns, shapes
+
+def _build_bars(first_closes, returns, shapes):
+    closes = first_closes * np.exp(np.cumsum(returns, axis=1))
+    bars = np.empty(closes.shape[:2] + (4,) + closes.shape[2:])
+    bars[:, :, :3] = closes[:, :, None] * np.exp(shapes)
+    bars[:, :, 3] = closes
+    return bars
+
+
+# (paths x length x 4 x tickers) Open, High, Low, Close of daily bars made of blocks of consecutive days
+# of the history bars (days x 4 x tickers), all tickers take the same days so their correlation is kept.
+# Every path starts from the first Close of the history, length is the number of days after it
+def bootstrap_bars(bars, n_paths, length=None, block=20, seed=None):
+    returns, shapes = _split_days(bars)
+    length = len(returns) if length is None else length
+    positions = block_positions(len(returns), n_paths, length, block, np.random.default_rng(seed))
+    return _build_bars(np.asarray(bars)[0, 3], returns[positions], shapes[positions])
+
+
+# as bootstrap_bars but close returns are drawn from a normal distribution with the mean and covariance of
+# the history ones (geometric brownian motion), Open, High and Low around the Close are taken from random days
+def parametric_bars(bars, n_paths, length=None, seed=None):
+    returns, shapes = _split_days(bars)
+    length = len(returns) if length is None else length
+    rng = np.random.default_rng(seed)
+    mean = returns.mean(axis=0)
+    covariance = np.atleast_2d(np.cov(returns, rowvar=False))
+    drawn = rng.multivariate_normal(mean, covariance, size=(n_paths, length))
+    positions = rng.integers(0, len(shapes), (n_paths, length))
+    return _build_bars(np.asarray(bars)[0, 3], drawn, shapes[positions])
+
+
+# result of run_batch, every array has a value per path
+class BatchResult:
+    def __init__(self, final_equity, max_drawdown, trades, total_comission, equity=None):
+        self.__final_equity = final_equity
+        self.__max_drawdown = max_drawdown
+        self.__trades = trades
+        self.__total_comission = total_comission
+        self.__equity = equity
+
+    def __len__(self):
+        return len(self.__final_equity)
+
+    def get_final_equity(self):
+        return self.__final_equity
+    def get_max_drawdown(self):
+        return self.__max_drawdown
+    def get_trades(self):
+        return self.__trades
+    def get_total_comission_loss(self):
+        return self.__total_comission
+    # (paths x days) portfolio costs at the day closes, None unless run_batch kept them
+    def get_equity(self):
+        return self.__equity
+
+    # a row per path
+    def get_table(self):
+        return pd.DataFrame({"final_equity": self.__final_equity, "max_drawdown": self.__max_drawdown,
+                             "trades": self.__trades, "comission": self.__total_comission})
+
+
+# runs a batch strategy over all paths at once, loops go over days and tickers only
+# strategy.start(n_paths, n_tickers) is called first, then strategy.step(day, bars) at every day with
+# (paths x 4 x tickers) bars of the day, it returns (buy_sizes, buy_prices, sell_sizes, sell_prices) of (paths x tickers)
+# arrays: numbers of stocks and fill prices, nan price - no fill. Sell sizes may be ALL, sell sizes and prices
+# may be lists of such arrays that are applied one after another. Buys go first in tickers order then sells,
+# as vectorized.run_signals does; positions are valued at the day Close
+def run_batch(strategy, bars, start_funds, comission=0, keep_equity=False):
+    if comission < 0 or comission > 1:
+        raise ValueError("comission must be in range [0.0, 1.0]")
+    bars = np.asarray(bars, dtype=np.float64)
+    if bars.ndim != 4 or bars.shape[2] != 4:
+        raise RobustnessError("bars must be a (paths x days x 4 x tickers) array")
+    n_paths, n_days, _, n_tickers = bars.shape
+
+    money = np.full(n_paths, float(start_funds))
+    owned = np.zeros((n_paths, n_tickers), dtype=np.int64)
+    trades = np.zeros(n_paths, dtype=np.int64)
+    total_comission = np.zeros(n_paths)
+    equity = money.copy()
+    peaks = money.copy()
+    drawdowns = np.zeros(n_paths)
+    history = np.empty((n_paths, n_days)) if keep_equity else None
+
+    strategy.start(n_paths, n_tickers)
+    for day in range(n_days):
+        buy_sizes, buy_prices, sell_sizes, sell_prices = strategy.step(day, bars[:, day])
+        for i in range(n_tickers):
+            n = buy_sizes[:, i]
+            total_price = buy_prices[:, i] * n
+            fill_comission = total_price * comission
+            filled = (n > 0) & (money >= total_price + fill_comission)
+            money = np.where(filled, money - total_price - fill_comission, money)
+            owned[filled, i] += n[filled]
+            trades += filled
+            total_comission += np.where(filled, fill_comission, 0)
+
+        if not isinstance(sell_sizes, (list, tuple)):
+            sell_sizes, sell_prices = [sell_sizes], [sell_prices]
+        for sizes, prices in zip(sell_sizes, sell_prices):
+            for i in range(n_tickers):
+                n = np.where(sizes[:, i] == ALL, owned[:, i], sizes[:, i])
+                total_price = prices[:, i] * n
+                fill_comission = total_price * comission
+                filled = (n > 0) & (owned[:, i] >= n) & ~np.isnan(total_price)
+                money = np.where(filled, money + total_price - fill_comission, money)
+                owned[filled, i] -= n[filled]
+                trades += filled
+                total_comission += np.where(filled, fill_comission, 0)
+
+        stock_values = owned * np.nan_to_num(bars[:, day, 3])
+        equity = money + (stock_values - stock_values * comission).sum(axis=1)
+        peaks = np.maximum(peaks, equity)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            drawdowns = np.maximum(drawdowns, np.where(peaks > 0, (peaks - equity) / peaks, 0.0))
+        if keep_equity:
+            history[:, day] = equity
+    return BatchResult(equity, drawdowns, trades, total_comission, history)
+
+
+# 80-20's algorithm (example_80-20s.py) on daily bars: yesterday's bar sets the levels as there,
+# a level counts as reached when the day range touches it and the fill is at the level or at the Open
+# if the day opened beyond it, as resting limit orders fill
+class Batch8020:
+    def __init__(self, low_band=0.2, high_band=0.8):
+        self.__low_band = low_band
+        self.__high_band = high_band
+        self.__buy_levels = None
+        self.__sell_levels = None
+
+    def start(self, n_paths, n_tickers):
+        self.__buy_levels = np.full((n_paths, n_tickers), np.nan)
+        self.__sell_levels = np.full((n_paths, n_tickers), np.nan)
+
+    def step(self, day, bars):
+        opens, highs, lows, closes = bars[:, 0], bars[:, 1], bars[:, 2], bars[:, 3]
+        with np.errstate(invalid="ignore"):
+            bought = lows <= self.__buy_levels
+            sold = highs >= self.__sell_levels
+        buy_prices = np.where(bought, np.minimum(self.__buy_levels, opens), np.nan)
+        sell_prices = np.where(sold, np.maximum(self.__sell_levels, opens), np.nan)
+
+        ranges = highs - lows
+        to_sell = (opens <= self.__low_band * ranges + lows) & (closes >= self.__high_band * ranges + lows)
+        to_buy = ~to_sell & (closes <= self.__low_band * ranges + lows) & (opens >= self.__high_band * ranges + lows)
+        traded = ~np.isnan(closes).any(axis=1, keepdims=True)   # no data: the next day is skipped
+        self.__sell_levels = np.where(to_sell & traded, closes, np.nan)
+        self.__buy_levels = np.where(to_buy & traded, closes, np.nan)
+        return bought.astype(np.int64), buy_prices, np.where(sold, ALL, 0), sell_prices
+
+
+# runs a batch strategy over bootstrapped paths of the tickers daily history between the dates
+# method: "bootstrap" or "parametric", see bootstrap_bars and parametric_bars
+# returns BatchResult of every path
+def evaluate_batch(strategy, tickers, start_date, end_date, start_funds, comission=0, n_paths=1000, provider=None,
+                   method="bootstrap", length=None, block=20, seed=None, keep_equity=False):
+    days, bars = get_day_bar_matrix(tickers, start_date, end_date, provider)
+    if method == "bootstrap":
+        paths = bootstrap_bars(bars, n_paths, length, block, seed)
+    elif method == "parametric":
+        paths = parametric_bars(bars, n_paths, length, seed)
+    else:
+        raise RobustnessError(f"unknown method {method}")
+    return run_batch(strategy, paths, start_funds, comission, keep_equity)
+
+
+# bars of the tickers made of whole sessions of the source bars drawn in blocks of consecutive sessions,
+# every ticker takes the same sessions. The sessions are put on the dates of the source sessions and
+# scaled so that each one starts from the previous one's Close with its own overnight gap.
+# Bars of base_interval are built here, coarser intervals and daily bars are aggregated by the market
+# so any strategy can run over a path as over the source data
+class BootstrapProvider(DataProvider):
+    def __init__(self, source, tickers, base_interval="30m", block=5, seed=0, start=None, end=None):
+        if not base_interval in INTRADAY_MINUTES:
+            raise UnsupportedIntervalError(base_interval)
+        self.__base_interval = base_interval
+        self.__block = block
+        self.__seed = seed
+        self.__tickers = list(tickers)
+
+        indices = [get_bar_index(ticker, base_interval, source) for ticker in self.__tickers]
+        days = [index.get_dates() - index.get_dates() % DAY_NS for index in indices]
+        sessions = [np.unique(ticker_days, return_index=True, return_counts=True) for ticker_days in days]
+        common = reduce(np.intersect1d, [ticker_sessions[0] for ticker_sessions in sessions])
+        if start is not None:
+            common = common[common >= to_timestamp(start)]
+        if end is not None:
+            common = common[common <= to_timestamp(end)]
+        # sessions with the same number of bars for all tickers
+        firsts, counts = [], []
+        for ticker_days, first, count in sessions:
+            positions = np.searchsorted(ticker_days, common)
+            firsts.append(first[positions])
+            counts.append(count[positions])
+        equal = np.all([count == counts[0] for count in counts], axis=0)
+        self.__days = common[equal]
+        if len(self.__days) == 0:
+            raise RobustnessError("no sessions to bootstrap")
+        self.__counts = counts[0][equal]
+        self.__starts = np.concatenate([[0], np.cumsum(self.__counts)[:-1]])
+
+        # bars of the kept sessions relative to the Close before them
+        self.__relative = {}
+        self.__volumes = {}
+        self.__offsets = {}
+        self.__first_close = {}
+        for ticker, index, ticker_days, first in zip(self.__tickers, indices, days, firsts):
+            first = first[equal]
+            positions = np.repeat(first - self.__starts, self.__counts) + np.arange(self.__counts.sum())
+            closes = np.asarray(index.get_column("Close"))
+            previous = np.where(first > 0, closes[np.maximum(first - 1, 0)], np.asarray(index.get_column("Open"))[first])
+            values = np.stack([np.asarray(index.get_column(column))[positions] for column in ["Open", "High", "Low", "Close"]], axis=1)
+            self.__relative[ticker] = values / np.repeat(previous, self.__counts)[:, None]
+            self.__volumes[ticker] = np.asarray(index.get_column("Volume"))[positions]
+            self.__offsets[ticker] = index.get_dates()[positions] - ticker_days[positions]
+            self.__first_close[ticker] = previous[0]
+        self.__order = None
+
+    # the same sessions bootstrapped with another seed, nothing is copied
+    def with_seed(self, seed):
+        provider = copy.copy(self)
+        provider.__seed = seed
+        provider.__order = None
+        return provider
+
+    def get_name(self):
+        return f"BootstrapProvider_{self.__seed}"
+
+    def get_tickers(self):
+        return self.__tickers
+
+    def get_base_interval(self, interval):
+        return get_pyramid_base(self.__base_interval, interval)
+
+    # positions of the source sessions at the dates of the path
+    def get_order(self):
+        if self.__order is None:
+            rng = np.random.default_rng(self.__seed)
+            self.__order = block_positions(len(self.__days), 1, len(self.__days), self.__block, rng)[0]
+        return self.__order
+
+    def download(self, ticker, interval, start_period=None):
+        if interval != self.__base_interval:
+            raise UnsupportedIntervalError(interval)
+        if not ticker in self.__relative:
+            raise RobustnessError(f"{ticker} is not bootstrapped")
+        order = self.get_order()
+        counts = self.__counts[order]
+        positions = np.repeat(self.__starts[order] - np.concatenate([[0], np.cumsum(counts)[:-1]]), counts) + np.arange(counts.sum())
+
+        relative = self.__relative[ticker]
+        session_returns = relative[self.__starts + self.__counts - 1, 3]
+        levels = self.__first_close[ticker] * np.concatenate([[1], np.cumprod(session_returns[order])[:-1]])
+        values = relative[positions] * np.repeat(levels, counts)[:, None]
+        stamps = np.repeat(self.__days, counts) + self.__offsets[ticker][positions]
+
+        data = pd.DataFrame({"Open": values[:, 0], "High": values[:, 1], "Low": values[:, 2], "Close": values[:, 3],
+                             "Volume": self.__volumes[ticker][positions]},
+                            index=pd.DatetimeIndex(stamps.astype("datetime64[ns]"), name="Datetime"), columns=BAR_COLUMNS)
+        if start_period is not None:
+            data = data.loc[start_period:]
+        return data
+
+
+_source = None   # BootstrapProvider of a worker process
+
+def _init_worker(root, tickers, base_interval, block, start, end):
+    global _source
+    _source = BootstrapProvider(init_worker(root), tickers, base_interval, block, 0, start, end)
+
+
+def _run_path(strategy_class, seed, base_kwargs, start_date, end_date):
+    result = {"seed": seed}
+    kwargs = dict(base_kwargs)
+    kwargs["provider"] = _source.with_seed(seed)
+
+    begin = time.perf_counter()
+    try:
+        simulator = strategy_class(**kwargs)
+        simulator.run(start_date, end_date)
+        _, equity = simulator.get_equity_series()
+        result["final_equity"] = simulator.get_portfolio_cost()
+        result["max_drawdown"] = max_drawdown(equity)
+        result["trades"] = len(simulator.get_ledger())
+        result["error"] = None
+    except Exception:
+        result.update({column: None for column in RESULT_COLUMNS})
+        result["error"] = traceback.format_exc()
+    result["seconds"] = time.perf_counter() - begin
+    return result
+
+
+# runs strategy_class (an AccountSimulator subclass that takes provider keyword) over n_paths bootstrapped
+# histories of its tickers in a pool of processes, see BootstrapProvider. Base bars are loaded once and shared
+# with the workers through memory mapped files. Path i is bootstrapped with seed + i
+# history_start, history_end: sessions to draw from, all loaded ones by default
+# returns a table with a row per path, failed runs have a traceback in "error" column
+def run_paths(strategy_class, n_paths, start_date, end_date, base_kwargs=None, provider=None, base_interval="30m",
+              block=5, seed=0, history_start=None, history_end=None, processes=None, data_dir=None):
+    base_kwargs = {} if base_kwargs is None else dict(base_kwargs)
+    tickers = sorted(set(base_kwargs.get("tickers", [])))
+    if len(tickers) == 0:
+        raise RobustnessError("base_kwargs must have tickers")
+
+    def failure(i, error):
+        print(f"WARNING: path {seed + i} failed", file=sys.stderr)
+        return dict({column: None for column in RESULT_COLUMNS}, seed=seed + i, error=error, seconds=None)
+
+    tasks = [(strategy_class, seed + i, base_kwargs, start_date, end_date) for i in range(n_paths)]
+    initargs = (tickers, base_interval, block, history_start, history_end)
+    rows = run_pool(_run_path, tasks, tickers, [base_interval], failure, provider, _init_worker, initargs,
+                    processes, data_dir, prefix="paths_")
+    return pd.DataFrame(rows)
+
+
+# quantiles of the result columns of a table of run_paths or BatchResult.get_table
+def summarize(table, quantiles=(0.05, 0.25, 0.5, 0.75, 0.95)):
+    columns = [column for column in RESULT_COLUMNS if column in table.columns]
+    values = table[columns].astype(float)
+    summary = values.quantile(list(quantiles))
+    summary.loc["mean"] = values.mean()
+    return summary
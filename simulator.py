@@ -1,13 +1,31 @@
 from datetime import date, timedelta, datetime
+import os
+import copy
+import heapq
+import pickle
+import itertools
 import yfinance as yf
 from stock import Stock
-from market import Market, EmptyDataError
-from pandas.tseries.offsets import BDay
+import market
+from market import Market, EmptyDataError, get_bar_index, prefetch, print_progress
+from trading_calendar import get_default_calendar
+from indicators import IndicatorSet
+from valuation import Valuation
+from metrics import get_turnover, get_ticker_pnl
+from ledger import Ledger, BUY, SELL, SIDES, ALL
+from orders import OrderBook, OrderError, ORDER_TYPES, MARKET, LIMIT, STOP, STOP_LIMIT, TRAILING_STOP, FILLED, REJECTED, NO_SUBMISSION
+from journal import RunJournal
+from profiler import Profiler, count_cache_infos
+from time import perf_counter
+import plotting
 import sys
 import pytz
 import matplotlib.pyplot as plt
 
 
+EVENT_INTERVALS = ["1m", "5m", "30m", "1h", "1d"]
+
+
 class SimulatorError(Exception):
     pass
 
@@ -15,36 +33,61 @@ class InvalidInterval(SimulatorError):
     pass
 
 
+# ticks that run goes over from start_date up to end_date
+def get_ticks(start_date, end_date, calendar=None):
+    if calendar is None:
+        calendar = get_default_calendar()
+    return calendar.get_ticks(start_date, end_date)
+
+
 class AccountSimulator:
     # algorithm will decide what to buy and to sell and when
-    def __init__(self, start_funds, comission = 0):
+    # provider: source of market data, yfinance is used if it is None
+    # calendar: trading sessions, New York stock exchange calendar is used if it is None
+    def __init__(self, start_funds, comission = 0, provider = None, calendar = None):
         if comission < 0 or comission > 1:
             raise ValueError("comission must be in range [0.0, 1.0]")
         self.__start_money = start_funds
         self.__money = start_funds
         self.__comission_percent = comission
         self.__stocks = {}    # ticker -> Stock(ticker)
-        self.__history = {}   # ticker -> [(date, 'buy'/'sell', quantity, price, comission)]
+        self.__history = Ledger()   # (date, ticker, buy/sell, quantity, price, comission) columns
         self.__date = None    # will be set during run
         self.__start_date = None
         self.__end_date = None
         self.__market = None  # will be set according to the date
+        self.__provider = provider
+        self.__calendar = get_default_calendar() if calendar is None else calendar
+        self.__indicators = IndicatorSet(provider)
+        self.__valuation = Valuation(comission)
+        self.__orders = OrderBook()
+        self.__feature_store = None
+        self.__subscriptions = []   # tickers of run_events
+        self.__journal = None
+        self.__journal_row = 0   # the first ledger row that has not been written to the journal
+        self.__journal_path = None
+        self.__journal_offset = None   # journal size at the last checkpoint
+        self.__skipped_day = None      # the rest of this day is skipped by run
+        self.__checkpoint_path = None
+        self.__checkpoint_every = None
+        self.__next_checkpoint = None
         self.__total_comission_loss = 0
+        self.__profiler = None   # timers and counters of run, see enable_profiling
+        self.__run_begin = None  # perf_counter() at the first profiled step
+        self.__cache_infos = None
+        self.__shared_market = False   # the market came from begin_run and is profiled by its owner
 
 
     def get_free_money(self):
         return self.__money
     def get_active_money(self):  # how much all stocks cost now in total
-        res = [self.get_stock_total_cost(ticker) for ticker in self.__stocks.keys()]
-        return sum(res)
+        return self.__valuation.get_value(self.__market)
     def get_stock_total_cost(self, ticker):
         stock = self.__stocks[ticker]
         n = stock.get_quantity()
+        if n == 0:
+            return 0
         price = self.__market.get_current_price(ticker)
-        date = self.__date
-        while price == None:
-            date = date - timedelta(1)
-            price = self.__market.get_price(ticker, date)
         total_price = n * price
         comission = total_price * self.__comission_percent
         return total_price - comission
@@ -54,10 +97,33 @@ class AccountSimulator:
         return self.__stocks
     def get_owned_stock(self, ticker):
         return self.__stocks[ticker]
+    # (dates, portfolio costs) at every tick of the run
+    def get_equity_series(self):
+        return self.__valuation.get_equity_series()
+    # equity, free money and stocks value of every tick with running statistics, see metrics.EquityCurve
+    def get_equity_curve(self):
+        return self.__valuation.get_curve()
+    # metrics of the equity curve so far with turnover, comission loss and number of operations
+    def get_metrics(self):
+        metrics = self.__valuation.get_curve().get_metrics()
+        metrics["turnover"] = get_turnover(self.__history, self.__valuation.get_curve())
+        metrics["comission"] = float(self.__history.get_column('comission').sum())
+        metrics["operations"] = len(self.__history)
+        return metrics
+    # metrics of the last window ticks, strategies may use them during run
+    def get_rolling_metrics(self, window):
+        return self.__valuation.get_curve().get_rolling_metrics(window)
+    # ticker -> profit of its operations and of the owned stocks at the current price
+    def get_ticker_pnl(self):
+        values = {ticker: self.get_stock_total_cost(ticker) for ticker, stock in self.__stocks.items() if stock.get_quantity() != 0}
+        return get_ticker_pnl(self.__history, values)
+    # ticker -> [(date, 'buy'/'sell', quantity, price, comission)]
     def get_operations_history(self):
-        return self.__history
+        return self.__history.get_history()
     def get_ticker_operation_history(self, ticker):
-        return self.__history[ticker]
+        return self.__history.get_ticker_history(ticker)
+    def get_ledger(self):
+        return self.__history
     def get_date(self):
         return self.__date
     def get_start_date(self):
@@ -66,6 +132,10 @@ class AccountSimulator:
         return self.__end_date
     def get_market(self):
         return self.__market
+    def get_provider(self):
+        return self.__provider
+    def get_calendar(self):
+        return self.__calendar
     def get_total_comission_loss(self):
         return self.__total_comission_loss
     def get_quantity(self, ticker):
@@ -74,18 +144,127 @@ class AccountSimulator:
         else:
             return self.__stocks[ticker].get_quantity()
 
+    # indicator is fed with bars of the interval as the simulation goes
+    def add_indicator(self, ticker, name, indicator, interval = "1d"):
+        self.__indicators.add(ticker, name, indicator, interval)
+    def get_indicator(self, ticker, name):
+        return self.__indicators.get(ticker, name)
+
+    # daily features of a large universe for screening, see feature_store.FeatureStore
+    def set_feature_store(self, store):
+        self.__feature_store = store
+    def get_feature_store(self):
+        return self.__feature_store
+    # tickers which features of the last finished day satisfy predicate, so only they get per ticker lookups:
+    # self.screen(lambda f: (f["open_position"] <= 0.2) & (f["close_position"] >= 0.8))
+    def screen(self, predicate):
+        if self.__feature_store is None:
+            raise SimulatorError("no feature store is set")
+        return self.__feature_store.screen(self.__date, predicate)
+
+    # loads bars of the tickers concurrently before run so no download happens inside the loop
+    # returns {ticker: {interval: error message}} of the series that could not be loaded, see market.prefetch
+    def prepare(self, tickers, intervals = ("1d", "1h", "30m"), start_date = None, end_date = None, threads = 8,
+                retries = 2, progress = True):
+        failures = prefetch(tickers, intervals, self.__provider, start_date, end_date, threads, retries,
+                            progress=print_progress if progress else None)
+        for ticker, errors in failures.items():
+            for interval, error in errors.items():
+                print(f"WARNING: {ticker} {interval} bars are not loaded: {error}", file=sys.stderr)
+        return failures
+
+    # run phases, market lookups and skipped days are measured from the next run on
+    # returns the profiler, its summary can be exported after the run
+    def enable_profiling(self, profiler = None):
+        self.__profiler = Profiler() if profiler is None else profiler
+        return self.__profiler
+    def disable_profiling(self):
+        self.__profiler = None
+    def get_profiler(self):
+        return self.__profiler
+
+    # orders: 'market' is filled at once at the current price like buy and sell,
+    # 'limit' (limit_price), 'stop' (stop_price), 'stop_limit' (both) and 'trailing_stop' (trail amount)
+    # rest in the book and are checked against the current bars after every algorithm call.
+    # quantity of sell orders may be ALL to sell the whole position when the order is filled
+    # expiry: datetime, "day" (close of the current session) or None
+    # returns the order id
+    def submit_order(self, ticker, side, quantity, order_type = "market", limit_price = None, stop_price = None,
+                     trail = None, expiry = None):
+        if not side in SIDES:
+            raise OrderError(f"unknown side {side}")
+        if not order_type in ORDER_TYPES:
+            raise OrderError(f"unknown order type {order_type}")
+        side = SIDES.index(side)
+        order_type = ORDER_TYPES.index(order_type)
+        if quantity <= 0 and not (side == SELL and quantity == ALL):
+            raise OrderError(f"invalid quantity {quantity}")
+        if order_type in (LIMIT, STOP_LIMIT) and limit_price is None:
+            raise OrderError("limit orders require limit_price")
+        if order_type in (STOP, STOP_LIMIT) and stop_price is None:
+            raise OrderError("stop orders require stop_price")
+        if order_type == TRAILING_STOP and (trail is None or trail <= 0):
+            raise OrderError("trailing stops require a positive trail")
+        if expiry == "day":
+            expiry = self.__calendar.get_session_close(self.__date)
+
+        reference = self.__market.get_current_price(ticker) if order_type == TRAILING_STOP else float("nan")
+        order_id = self.__orders.add(ticker, side, order_type, quantity,
+                                     float("nan") if limit_price is None else limit_price,
+                                     float("nan") if stop_price is None else stop_price,
+                                     float("nan") if trail is None else trail, reference, expiry, self.__date)
+        if order_type == MARKET:
+            price = self.__market.get_current_price(ticker)
+            self.__orders.set_status(order_id, FILLED if self.__fill_order(order_id, price) else REJECTED)
+        return order_id
+
+    def cancel_order(self, order_id):
+        self.__orders.cancel(order_id)
+    def get_order(self, order_id):
+        return self.__orders.get_order(order_id)
+    def get_open_orders(self, ticker = None):
+        return [self.__orders.get_order(order_id) for order_id in self.__orders.get_open_ids(ticker)]
+    def get_order_book(self):
+        return self.__orders
+
+    # (bar, start timestamp) of the current bar of the ticker
+    def __get_order_bar(self, ticker):
+        try:
+            return self.__market.get_current_bar(ticker), self.__market.get_current_bar_timestamp(ticker)
+        except EmptyDataError:
+            return (float("nan"),) * 5, NO_SUBMISSION
+
+    def __fill_order(self, order_id, price):
+        order = self.__orders
+        ticker = order.get_tickers()[order.get_column('ticker_id')[order_id]]
+        n = int(order.get_column('quantity')[order_id])
+        mark = self.__market.get_current_price(ticker)
+        if order.get_column('side')[order_id] == BUY:
+            return self.__buy_at(ticker, n, price, mark)
+        if n == ALL:
+            n = self.get_quantity(ticker)
+        if n <= 0 or not self.__check_selling(ticker, n):
+            return False
+        return self.__sell_at(ticker, n, price, mark)
+
+    # fills the resting orders reached by the current bars
+    def __execute_orders(self):
+        order_ids, prices = self.__orders.evaluate(self.__date, self.__get_order_bar)
+        for order_id, price in zip(order_ids, prices):
+            self.__orders.set_status(order_id, FILLED if self.__fill_order(order_id, float(price)) else REJECTED)
+
     def set_algorithm(self, new_algorithm):
         self.__algorithm = new_algorithm
 
     def print_operations_history(self, file):
-        keys = self.__history.keys()
+        keys = self.__history.get_tickers()
         if len(keys) == 0:
             file.write("no history\n")
         else:
             for ticker in keys:
                 self.print_ticker_operation_history(ticker, file)
     def print_ticker_operation_history(self, ticker, file):
-        ticker_history = self.__history[ticker]
+        ticker_history = self.__history.get_ticker_history(ticker)
         file.write(ticker + ":\n")
         for event in ticker_history:
             file.write(f"{event[0]}: {event[1]} {event[2]} stock(s) for {event[3]:.3f} each with {event[4]:.3f} comission\n")
@@ -100,7 +279,7 @@ class AccountSimulator:
                     file.write(f"{ticker}: {n}\n")
 
     def stock_plot(self, ticker, start_date, end_date, interval = "1d"):
-        market = Market(end_date)
+        market = Market(end_date, self.__provider)
         data = market.get_data(ticker, start_date, end_date, interval)['Close']
         plt.plot(data)
         plt.title(ticker + ": " + str(start_date) + " - " + str(end_date) + "; interval " + interval)
@@ -110,8 +289,7 @@ class AccountSimulator:
         if len(self.__history) == 0 or self.__start_date is None or self.__end_date is None:
             print(f"WARNING: no history available", file=sys.stderr)
             return
-        history_data = self.__history[ticker]
-        market = Market(self.__end_date)
+        market = Market(self.__end_date, self.__provider)
         data = market.get_data(ticker, self.__start_date, self.__end_date, "1h")['Close']
 
         data_plot = list(data)
@@ -135,124 +313,120 @@ class AccountSimulator:
         if show:
             plt.show()
 
-    def history_plot(self, show = False):
-        for ticker in self.__history:
+    # plots are drawn without a window by processes workers when they are not shown
+    def history_plot(self, show = False, directory = ".", processes = None, max_points = 2000):
+        if not show:
+            if len(self.__history) == 0 or self.__start_date is None or self.__end_date is None:
+                print(f"WARNING: no history available", file=sys.stderr)
+                return []
+            begin = perf_counter()
+            paths = plotting.render_history(self, directory, processes, max_points)
+            if self.__profiler is not None:
+                self.__profiler.stop("report.plot", begin)
+            return paths
+        for ticker in self.__history.get_tickers():
             self.ticker_history_plot(ticker, show)
 
     def __get_stock_buy_history(self, ticker):
-        data = self.__history[ticker]
-        dates = []
-        prices = []
-        for tup in data:
-            # tup: (date, 'buy'/'sell', quantity, price, comission)
-            if tup[1] == 'buy':
-                dates.append(tup[0])
-                prices.append(tup[3])
-        return (dates, prices)
+        return self.__history.get_side_history(ticker, BUY)
 
     def __get_stock_sell_history(self, ticker):
-        data = self.__history[ticker]
-        dates = []
-        prices = []
-        for tup in data:
-            # tup: (date, 'buy'/'sell', quantity, price)
-            if tup[1] == 'sell':
-                dates.append(tup[0])
-                prices.append(tup[3])
-        return (dates, prices)
+        return self.__history.get_side_history(ticker, SELL)
 
 
     def __add_to_history(self, ticker, event, n, price, comission):
-        new_data = (self.__date, event, n, price, comission)
-        if not ticker in self.__history:
-            self.__history[ticker] = [new_data]
-        else:
-            self.__history[ticker].append(new_data)
+        self.__history.append(self.__date, ticker, BUY if event == 'buy' else SELL, n, price, comission)
 
 
     def buy(self, ticker, n):
         if n <= 0:
             return
-
         price = self.__market.get_current_price(ticker)
+        self.__buy_at(ticker, n, price, price)
+
+    # mark: the current price that the position is valued at
+    def __buy_at(self, ticker, n, price, mark):
         total_price = price * n
         comission = total_price * self.__comission_percent
 
         if self.__money < total_price + comission:
             print(f"WARNING: not enough money to buy {n} {ticker} stocks ${price} each with total comission {comission}", file=sys.stderr)
             print(f"No {ticker} stocks bought", file=sys.stderr)
-            return
+            return False
 
         self.__money -= total_price
         self.__money -= comission
         self.__add_to_history(ticker, 'buy', n, price, comission)
+        self.__valuation.on_fill(ticker, n, mark, self.__date)
         if ticker in self.__stocks.keys():
             self.__stocks[ticker].buy(price, n)
         else:
             stock = Stock(ticker)
             stock.buy(price, n)
             self.__stocks[ticker] = stock
+        return True
 
     def sell(self, ticker, n):
         if n <= 0:
             return
+        if not self.__check_selling(ticker, n):
+            return
+        price = self.__market.get_current_price(ticker)
+        self.__sell_at(ticker, n, price, price)
 
+    def __check_selling(self, ticker, n):
         if not ticker in self.__stocks.keys():
             print(f"WARNING: no {ticker} stocks are available for selling", file=sys.stderr)
             print(f"No {ticker} stocks sold", file=sys.stderr)
-            return
+            return False
 
         n_stocks_available = self.__stocks[ticker].get_quantity()
         if n_stocks_available < n:
             print(f"WARNING: {n_stocks_available} {ticker} stocks out of {n} requested are available for selling", file=sys.stderr)
             print(f"No {ticker} stocks sold", file=sys.stderr)
-            return
+            return False
+        return True
 
-        price = self.__market.get_current_price(ticker)
+    def __sell_at(self, ticker, n, price, mark):
         total_price = price * n
         comission = total_price * self.__comission_percent
 
         self.__money += total_price
         self.__money -= comission
         self.__add_to_history(ticker, 'sell', n, price, comission)
-        self.__stocks[ticker].sell(n)
+        self.__valuation.on_fill(ticker, -n, mark, self.__date)
+        self.__stocks[ticker].sell(n, price)
+        return True
 
     # working hours 9:30 - 15:59
     def is_working_hour(self, date):
         return not (self.__date.hour >= 16 or self.__date.hour < 9 or (self.__date.hour == 9 and self.__date.minute < 30))
 
+    # the current tick is the last one of its session
+    def is_session_end(self):
+        return self.__calendar.is_session_end(self.__date)
+
     def is_working_date(self, date):
-        if date.weekday > 4:
+        if not self.__calendar.is_session(date):
             return False
         if not self.is_working_hour(date):
             return False
         return True
 
 
-    def __upd_date(self):
-        weekday = self.__date.weekday() # 0 - Mon ... 6 - Sun
-        # weekends or the end of the friday
-        if weekday > 4 or (self.__date.hour == 15 and self.__date.minute == 30 and weekday == 4):
-            self.__date = self.__date + timedelta(days=7-weekday)
-            self.__date = self.__date.replace(hour = 9, minute = 30)
-        # the end of the day
-        elif (self.__date.hour == 15 and self.__date.minute == 30) or self.__date.hour >= 16:
-            self.__date = self.__date + timedelta(days=1)
-            self.__date = self.__date.replace(hour = 9, minute = 30)
-        elif self.__date.hour < 9 or  (self.__date.hour == 9 and self.__date.minute < 30):
-            self.__date = self.__date.replace(hour = 9, minute = 30)
-        else:
-            self.__date = self.__date + timedelta(hours=1)
-
-    def __skip_day(self):
-        self.__date = self.__date + BDay(1)
-        self.__date = self.__date.replace(hour = 9, minute = 30)
-
+    def print_metrics(self, file = sys.stdout):
+        for name, value in self.get_metrics().items():
+            file.write(f"{name:16} {value:.6g}\n")
+        file.write("  profit by ticker:\n")
+        for ticker, pnl in sorted(self.get_ticker_pnl().items()):
+            file.write(f"{ticker:16} {pnl:.2f}\n")
 
     def print_day_results(self, file):
         file.write("\n")
         file.write(f"      {self.__date.strftime('%Y-%m-%d')}: day is over\n")
-        file.write(f"portfolio costs {self.get_portfolio_cost():.2f} = {self.get_free_money():.2f} free money left + {self.get_active_money():.2f} stocks cost in total\n")
+        free_money = self.get_free_money()
+        active_money = self.get_active_money()
+        file.write(f"portfolio costs {free_money + active_money:.2f} = {free_money:.2f} free money left + {active_money:.2f} stocks cost in total\n")
         file.write("  portfolio:\n")
         self.print_stocks(file)
         file.write("  history:\n")
@@ -260,6 +434,58 @@ class AccountSimulator:
         file.write("\n")
 
 
+    # journal gets the operations of the day and the portfolio state, see write_day_results
+    # it is closed at the end of run
+    def open_journal(self, path, mode = "w"):
+        self.close_journal()
+        self.__journal = RunJournal(path, mode)
+        self.__journal_row = len(self.__history)
+        self.__journal_path = path
+        self.__journal_offset = None
+    def get_journal(self):
+        return self.__journal
+    def close_journal(self):
+        if self.__journal is not None:
+            begin = perf_counter()
+            self.__journal.close()
+            self.__journal = None
+            if self.__profiler is not None:
+                self.__profiler.stop("journal.close", begin)
+
+    # appends operations made since the previous call and the portfolio state to the journal
+    # nothing is written if no journal is open (forks for example)
+    def write_day_results(self):
+        if self.__journal is None:
+            return
+        begin = perf_counter()
+        self.__journal.write_fills(self.__history, self.__journal_row)
+        self.__journal_row = len(self.__history)
+        free_money = self.get_free_money()
+        active_money = self.get_active_money()
+        quantities = {ticker: stock.get_quantity() for ticker, stock in self.__stocks.items() if stock.get_quantity() != 0}
+        self.__journal.write_day(self.__date, free_money + active_money, free_money, active_money, quantities)
+        if self.__profiler is not None:
+            self.__profiler.stop("journal.write", begin)
+
+
+    # tickers which bars run_events delivers to on_bar
+    def subscribe(self, tickers):
+        for ticker in ([tickers] if isinstance(tickers, str) else tickers):
+            if not ticker in self.__subscriptions:
+                self.__subscriptions.append(ticker)
+    def unsubscribe(self, ticker):
+        self.__subscriptions.remove(ticker)
+    def get_subscriptions(self):
+        return self.__subscriptions
+
+    # callbacks of run_events
+    def on_session_open(self, date):
+        pass
+    def on_bar(self, ticker, bar):
+        pass
+    def on_session_close(self, date):
+        pass
+
     def algorithm(self):
         print(f"     {self.__date}: hour is over")
         print(f"portfolio costs {self.get_portfolio_cost():.2f} = {self.get_free_money():.2f} free money left + {self.get_active_money():.2f} stocks cost in total")
@@ -269,18 +495,245 @@ class AccountSimulator:
         self.print_operations_history()
         print()
 
-    # run hours from start_date up to end_date exclusively
+    # state without the market and the journal, they are opened again on resume
+    # the default calendar is not stored, the provider and the strategy attributes are
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_AccountSimulator__market'] = None
+        state['_AccountSimulator__journal'] = None
+        state['_AccountSimulator__run_begin'] = None
+        state['_AccountSimulator__cache_infos'] = None
+        if self.__calendar is get_default_calendar():
+            state['_AccountSimulator__calendar'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.__calendar is None:
+            self.__calendar = get_default_calendar()
+        if self.__date is not None:
+            self.__market = Market(self.__date, self.__provider)
+        self.__shared_market = False
+
+    # every is a timedelta of simulated time between checkpoints written to path during run, path None disables them
+    def set_checkpoints(self, path, every = timedelta(days=1)):
+        self.__checkpoint_path = path
+        self.__checkpoint_every = every
+        self.__next_checkpoint = None if self.__date is None or path is None else self.__date + every
+
+    # the state after the last simulated tick, it is written to a temporary file first
+    # so a crash never leaves a broken checkpoint
+    def save_checkpoint(self, path):
+        if self.__journal is not None:
+            self.__journal_offset = self.__journal.sync()
+        temporary = path + ".tmp"
+        with open(temporary, "wb") as file:
+            pickle.dump(self, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, path)
+
+    # continue with resume()
+    @staticmethod
+    def load_checkpoint(path):
+        with open(path, "rb") as file:
+            return pickle.load(file)
+
+    # a copy that continues from the current tick independently: market data, the provider and the calendar
+    # are shared, the history is shared until one of them makes an operation
+    # the fork writes its journal (operations after the fork only) to journal_path if it is given
+    def fork(self, journal_path = None):
+        memo = {id(self.__provider): self.__provider, id(self.__calendar): self.__calendar,
+                id(self.__history): self.__history.fork(), id(self.__feature_store): self.__feature_store}
+        child = copy.deepcopy(self, memo)
+        child.__journal_path = None
+        child.__journal_offset = None
+        child.__checkpoint_path = None
+        child.__next_checkpoint = None
+        if journal_path is not None:
+            child.open_journal(journal_path)
+        return child
+
+    # run hours of trading sessions from start_date up to end_date
+    # holidays and early closes are known from the calendar in advance
     def run(self, start_date, end_date):
+        self.begin_run(start_date, end_date)
+        self.__loop()
+
+    # prepares a run from start_date up to end_date without going over its ticks, multirun.run_accounts
+    # then calls step for every tick and end_run. market: a Market shared with other accounts, its lookups
+    # are not counted by the profiler of this account, run_accounts gives it a profiler of its own choice
+    def begin_run(self, start_date, end_date, market = None):
+        if end_date < start_date:
+            raise InvalidInterval()
+
+        self.__date = start_date
+        self.__start_date = start_date
+        self.__end_date = end_date
+        self.__skipped_day = None
+        if self.__checkpoint_path is not None:
+            self.__next_checkpoint = start_date + self.__checkpoint_every
+        # the same market is moved forward with the simulation
+        self.__market = Market(self.__date, self.__provider) if market is None else market
+        self.__shared_market = market is not None
+
+    # continues run after the last simulated tick (of a checkpoint or of a fork) up to end_date
+    # the journal is truncated to its checkpoint size and appended
+    def resume(self, end_date = None):
+        if self.__date is None or self.__end_date is None:
+            raise SimulatorError("no run to resume")
+        if end_date is not None:
+            self.__end_date = end_date
+        if self.__journal is None and self.__journal_path is not None:
+            if self.__journal_offset is not None and os.path.exists(self.__journal_path):
+                os.truncate(self.__journal_path, self.__journal_offset)
+            self.__journal = RunJournal(self.__journal_path, "a")
+        self.__loop()
+
+    # event driven run: bars of the interval of all subscribed tickers between start_date and end_date
+    # are merged in time order and passed to on_bar(ticker, bar) with the clock at the bar date,
+    # so buy and sell fill at the bar Close as they do in run. on_session_open(date) is called before the first
+    # bar of a day and on_session_close(date) after its last one. Resting orders are checked and the portfolio
+    # cost is recorded after all bars of a date. EmptyDataError skips the rest of the day
+    def run_events(self, start_date, end_date, interval = "1h"):
         if end_date < start_date:
             raise InvalidInterval()
+        if not interval in EVENT_INTERVALS:
+            raise SimulatorError(f"unsupported event interval {interval}, use one of {EVENT_INTERVALS}")
 
         self.__date = start_date
         self.__start_date = start_date
         self.__end_date = end_date
-        while self.__date <= end_date:
-            self.__upd_date()
-            self.__market = Market(self.__date)
-            try:
-                self.algorithm()
-            except EmptyDataError:
-                self.__skip_day()
+        self.__market = Market(self.__date, self.__provider)
+        self.__shared_market = False
+        self.__market.set_price_interval(interval)
+        profiler = self.__profiler
+        if profiler is not None:
+            self.__market.set_profiler(profiler)
+
+        # a (bar date, subscription number, bar position) stream per ticker, merged with a heap
+        indices = []
+        streams = []
+        for k, ticker in enumerate(self.__subscriptions):
+            index = get_bar_index(ticker, interval, self.__provider)
+            first, last = index.get_range(start_date, end_date)
+            indices.append(index)
+            streams.append(zip(index.get_dates()[first:last].tolist(), itertools.repeat(k), range(first, last)))
+
+        current = None   # date of the bars being delivered
+        day = None
+        skipped_day = None
+        try:
+            for timestamp, k, position in heapq.merge(*streams):
+                if timestamp != current:
+                    if current is not None and skipped_day != day and not self.__finish_step():
+                        skipped_day = day
+                    date = datetime(1970, 1, 1) + timedelta(microseconds=timestamp // 1000)
+                    new_day = date.date() != day
+                    if new_day and day is not None and skipped_day != day:
+                        self.__call_event(self.on_session_close, self.__date)
+                    current = timestamp
+                    self.__date = date
+                    self.__market.advance(date)
+                    self.__indicators.advance(date)
+                    if new_day:
+                        day = date.date()
+                        skipped_day = None if self.__call_event(self.on_session_open, date) else day
+                    if profiler is not None:
+                        profiler.count("events.steps")
+                if skipped_day == day:
+                    continue
+                if profiler is not None:
+                    profiler.count("events.bars")
+                if not self.__call_event(self.on_bar, self.__subscriptions[k], indices[k].get_bar(position)):
+                    skipped_day = day
+            if current is not None and skipped_day != day and self.__finish_step():
+                self.__call_event(self.on_session_close, self.__date)
+        finally:
+            self.close_journal()
+
+    # returns False if EmptyDataError stopped the callback
+    def __call_event(self, callback, *args):
+        try:
+            callback(*args)
+            return True
+        except EmptyDataError:
+            if self.__profiler is not None:
+                self.__profiler.count("run.empty_data_errors")
+                self.__profiler.count("run.skipped_days")
+            return False
+
+    # resting orders and the portfolio cost after all bars of a date
+    def __finish_step(self):
+        return self.__call_event(self.__execute_orders) and self.__call_event(self.__valuation.record, self.__market, self.__money)
+
+    # ticks after the current date up to the end date
+    def __loop(self):
+        ticks = self.__calendar.get_ticks(self.__date, self.__end_date)
+        self.__valuation.get_curve().reserve(len(ticks))
+        try:
+            for date in ticks:
+                self.step(date)
+        finally:
+            self.end_run()
+
+    # one tick of the run clock
+    def step(self, date):
+        profiler = self.__profiler
+        if profiler is not None and self.__run_begin is None:
+            if not self.__shared_market:
+                self.__market.set_profiler(profiler)
+            self.__cache_infos = market.get_cache_infos()
+            self.__run_begin = perf_counter()
+        if self.__skipped_day == date.date():
+            if profiler is not None:
+                profiler.count("run.skipped_ticks")
+            return
+        self.__date = date
+        try:
+            if profiler is None:
+                self.__tick(date)
+            else:
+                self.__profiled_tick(date)
+        except EmptyDataError:  # no data of a ticker: the rest of the day is skipped
+            self.__skipped_day = date.date()
+            if profiler is not None:
+                profiler.count("run.empty_data_errors")
+                profiler.count("run.skipped_days")
+        if self.__next_checkpoint is not None and date >= self.__next_checkpoint:
+            self.save_checkpoint(self.__checkpoint_path)
+            self.__next_checkpoint = date + self.__checkpoint_every
+
+    # closes the journal and stops the run timer after the last step
+    def end_run(self):
+        self.close_journal()
+        if self.__run_begin is not None and self.__profiler is not None:
+            self.__profiler.stop("run", self.__run_begin)
+            count_cache_infos(self.__profiler, self.__cache_infos, market.get_cache_infos())
+            self.__run_begin = None
+            self.__cache_infos = None
+
+    def __tick(self, date):
+        self.__market.advance(date)
+        self.__indicators.advance(date)
+        self.algorithm()
+        self.__execute_orders()
+        self.__valuation.record(self.__market, self.__money)
+
+    # __tick with every phase timed
+    def __profiled_tick(self, date):
+        profiler = self.__profiler
+        profiler.count("run.ticks")
+        begin = perf_counter()
+        self.__market.advance(date)
+        profiler.stop("market.advance", begin)
+        begin = perf_counter()
+        self.__indicators.advance(date)
+        profiler.stop("indicators.advance", begin)
+        begin = perf_counter()
+        self.algorithm()
+        profiler.stop("algorithm", begin)
+        begin = perf_counter()
+        self.__execute_orders()
+        profiler.stop("orders.execute", begin)
+        begin = perf_counter()
+        self.__valuation.record(self.__market, self.__money)
+        profiler.stop("valuation.record", begin)
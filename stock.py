@@ -1,25 +1,75 @@
+from collections import deque
 
+
+# owned stocks of a ticker kept as lots: runs of stocks bought for the same price
+# stocks are sold in buying order (FIFO) as Tinkoff does
 class Stock:
     def __init__(self, ticker):
         self.__ticker = ticker
         self.__quantity = 0
-        self.__prices = []
-        self.__average_price = 0
+        self.__lots = deque()      # [price, quantity] in buying order
+        self.__total_cost = 0      # sum of buying prices of the owned stocks
+        self.__realized_pnl = 0
+        self.__closed_lots = []    # (buying price, selling price, quantity)
+
+    def get_ticker(self):
+        return self.__ticker
 
     def get_quantity(self):
         return self.__quantity
 
+    def get_average_price(self):
+        if self.__quantity == 0:
+            return 0
+        return self.__total_cost / self.__quantity
+
+    # [(price, quantity)] of the owned stocks in buying order
+    def get_lots(self):
+        return [(price, n) for price, n in self.__lots]
+
     def buy(self, price, n=1):
+        if n <= 0:
+            return
+        if len(self.__lots) > 0 and self.__lots[-1][0] == price:
+            self.__lots[-1][1] += n
+        else:
+            self.__lots.append([price, n])
         self.__quantity += n
-        self.__prices = self.__prices + [price for i in range(n)]
-        self.__average_price = self.__get_average_price()
+        self.__total_cost += price * n
+
+    # price is used for profit and loss accounting only
+    def sell(self, n=1, price=None):
+        if n <= 0:
+            return
+        if n > self.__quantity:
+            raise ValueError(f"{n} {self.__ticker} stocks can not be sold, {self.__quantity} are owned")
 
-    def sell(self, n=1):
         self.__quantity -= n
-        self.__prices = self.__prices[n:]  # as Tinkoff does
-        self.__average_price = self.__get_average_price()
+        while n > 0:
+            lot = self.__lots[0]
+            sold = min(n, lot[1])
+            self.__total_cost -= lot[0] * sold
+            if price is not None:
+                self.__realized_pnl += (price - lot[0]) * sold
+                self.__closed_lots.append((lot[0], price, sold))
+            lot[1] -= sold
+            if lot[1] == 0:
+                self.__lots.popleft()
+            n -= sold
 
-    def __get_average_price(self):
-        if len(self.__prices) == 0:
-            return 0
-        return sum(self.__prices) / len(self.__prices)
+        if self.__quantity == 0:
+            self.__total_cost = 0   # no rounding errors left after the position is closed
+
+    def get_realized_pnl(self):
+        return self.__realized_pnl
+
+    # [(buying price, selling price, quantity)] of sold lots
+    def get_closed_lots(self):
+        return self.__closed_lots
+
+    def get_unrealized_pnl(self, price):
+        return price * self.__quantity - self.__total_cost
+
+    # [(buying price, quantity, unrealized profit)] of the owned lots
+    def get_lots_pnl(self, price):
+        return [(lot_price, n, (price - lot_price) * n) for lot_price, n in self.__lots]
@@ -0,0 +1,123 @@
+import sys
+import time
+import shutil
+import tempfile
+import itertools
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+import market
+from market import get_data
+from providers import MemmapProvider
+
+
+class SweepError(Exception):
+    pass
+
+
+# all combinations of the grid values: {"a": [1, 2], "b": [3]} -> [{"a": 1, "b": 3}, {"a": 2, "b": 3}]
+# a list of parameter dicts is returned as it is
+def expand_grid(grid):
+    if isinstance(grid, (list, tuple)):
+        return [dict(parameters) for parameters in grid]
+    names = list(grid.keys())
+    return [dict(zip(names, values)) for values in itertools.product(*[grid[name] for name in names])]
+
+
+# downloads every (ticker, interval) series once and writes it as memory mapped files into root
+def share_data(root, tickers, intervals, provider=None):
+    for ticker in tickers:
+        for interval in intervals:
+            MemmapProvider.save(root, ticker, interval, get_data(ticker, interval, provider))
+    return MemmapProvider(root)
+
+
+_provider = None   # provider of a worker process
+
+# returns the provider of the shared files
+def init_worker(root):
+    global _provider
+    _provider = MemmapProvider(root)
+    market.set_offline(True)   # workers never download anything
+    return _provider
+
+
+# exports the (ticker, interval) series into root (a temporary directory if it is None) and calls
+# function(*arguments) for every arguments tuple of tasks in a pool of processes started with
+# initializer(root, *initargs). Results are returned in the order of tasks, a task whose worker
+# process died gets failure(i, traceback) instead. A temporary root is removed at the end
+def run_pool(function, tasks, tickers, intervals, failure, provider=None, initializer=init_worker, initargs=(),
+             processes=None, data_dir=None, prefix="sweep_"):
+    temporary = data_dir is None
+    root = tempfile.mkdtemp(prefix=prefix) if temporary else data_dir
+    try:
+        share_data(root, tickers, intervals, provider)
+        results = [None] * len(tasks)
+        with ProcessPoolExecutor(max_workers=processes, initializer=initializer, initargs=(root,) + tuple(initargs)) as pool:
+            futures = {pool.submit(function, *arguments): i for i, arguments in enumerate(tasks)}
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    results[i] = future.result()
+                except Exception:   # the worker process died
+                    results[i] = failure(i, traceback.format_exc())
+    finally:
+        if temporary:
+            shutil.rmtree(root, ignore_errors=True)
+    return results
+
+
+# "period" parameter is a (start_date, end_date) pair, the rest are passed to the strategy constructor
+def _run_one(strategy_class, parameters, base_kwargs, start_date, end_date):
+    result = dict(parameters)
+    kwargs = dict(base_kwargs)
+    kwargs.update(parameters)
+    if "period" in kwargs:
+        start_date, end_date = kwargs.pop("period")
+    kwargs["provider"] = _provider
+
+    begin = time.perf_counter()
+    try:
+        simulator = strategy_class(**kwargs)
+        simulator.run(start_date, end_date)
+        result["portfolio_cost"] = simulator.get_portfolio_cost()
+        result["free_money"] = simulator.get_free_money()
+        result["operations"] = len(simulator.get_ledger())
+        result["error"] = None
+    except Exception:
+        result["portfolio_cost"] = None
+        result["free_money"] = None
+        result["operations"] = None
+        result["error"] = traceback.format_exc()
+    result["seconds"] = time.perf_counter() - begin
+    return result
+
+
+# runs strategy_class (an AccountSimulator subclass that takes provider keyword) for every grid point
+# in a pool of processes. Price data of the tickers is loaded once and shared with the workers through
+# memory mapped files, every run reads it without downloading.
+# grid: {"comission": [0, 0.001], "low_band": [0.1, 0.2]} or a list of parameter dicts,
+#       "period": [(start_date, end_date), ...] sweeps date windows
+# base_kwargs: constructor parameters common for all runs, tickers are taken from "tickers" parameters
+# returns a table with a row per run, failed runs have a traceback in "error" column
+def run_sweep(strategy_class, grid, start_date=None, end_date=None, base_kwargs=None,
+              intervals=("1d", "1h", "30m"), processes=None, provider=None, data_dir=None):
+    base_kwargs = {} if base_kwargs is None else dict(base_kwargs)
+    runs = expand_grid(grid)
+    if len(runs) == 0:
+        raise SweepError("empty parameter grid")
+
+    tickers = set(base_kwargs.get("tickers", []))
+    for parameters in runs:
+        tickers.update(parameters.get("tickers", []))
+        if not "period" in parameters and (start_date is None or end_date is None):
+            raise SweepError("start_date and end_date or a period parameter are required")
+
+    def failure(i, error):
+        print(f"WARNING: run {runs[i]} failed", file=sys.stderr)
+        return dict(runs[i], portfolio_cost=None, free_money=None, operations=None, error=error, seconds=None)
+
+    tasks = [(strategy_class, parameters, base_kwargs, start_date, end_date) for parameters in runs]
+    rows = run_pool(_run_one, tasks, sorted(tickers), intervals, failure, provider,
+                    processes=processes, data_dir=data_dir)
+    return pd.DataFrame(rows)
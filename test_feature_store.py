@@ -0,0 +1,44 @@
+import os
+from datetime import datetime
+import numpy as np
+import pytest
+import feature_store
+from feature_store import FeatureStore
+from providers import SyntheticProvider
+
+
+class Interrupted(Exception):
+    pass
+
+
+def test_interrupted_update_leaves_the_previous_store(offline, tmp_path, monkeypatch):
+    provider = SyntheticProvider(seed=1, start=datetime(2020, 1, 1), end=datetime(2020, 7, 1))
+    root = str(tmp_path / "store")
+    store = FeatureStore(root)
+    store.update(["AAA", "BBB"], provider)
+    date = datetime(2020, 6, 1)
+    expected = store.get_features(date)
+
+    # adding a ticker writes wider matrices, the update stops before state.npz is replaced
+    replace = os.replace
+    def interrupted_replace(source, destination):
+        if destination.endswith("state.npz"):
+            raise Interrupted()
+        replace(source, destination)
+    monkeypatch.setattr(feature_store.os, "replace", interrupted_replace)
+    with pytest.raises(Interrupted):
+        store.update(["AAA", "BBB", "CCC"], provider)
+    monkeypatch.undo()
+
+    store = FeatureStore(root)
+    assert store.get_tickers() == ["AAA", "BBB"]
+    for feature, values in store.get_features(date).items():
+        np.testing.assert_array_equal(values, expected[feature])
+    store.screen(date, lambda f: f["rsi"] > 50)
+
+    store.update(["AAA", "BBB", "CCC"], provider)
+    assert store.get_tickers() == ["AAA", "BBB", "CCC"]
+    for feature, values in store.get_features(date).items():
+        np.testing.assert_array_equal(values[:2], expected[feature])
+    # only the files of the current generation are kept
+    assert sorted(os.listdir(root)) == sorted([f"{name}.2.npy" for name in ["dates"] + feature_store.FEATURES] + ["state.npz"])
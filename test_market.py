@@ -0,0 +1,18 @@
+from datetime import datetime
+import market
+from providers import SyntheticProvider
+
+
+def test_switching_the_default_provider_drops_cached_bars(offline):
+    previous = market.get_default_provider()
+    try:
+        market.set_default_provider(SyntheticProvider(seed=1, start=datetime(2020, 1, 1), end=datetime(2020, 7, 1)))
+        first = market.get_data("AAA", "1d")["Close"].iloc[-1]
+        first_index = market.get_bar_index("AAA", "1d").get_column("Close")[-1]
+        provider = SyntheticProvider(seed=2, start=datetime(2020, 1, 1), end=datetime(2020, 7, 1))
+        market.set_default_provider(provider)
+        expected = provider.download("AAA", "1d")["Close"].iloc[-1]
+        assert market.get_data("AAA", "1d")["Close"].iloc[-1] == expected != first
+        assert market.get_bar_index("AAA", "1d").get_column("Close")[-1] == expected != first_index
+    finally:
+        market.set_default_provider(previous)
@@ -0,0 +1,49 @@
+from datetime import datetime
+from market import get_bar_index
+from bar_index import to_timestamp
+from providers import SyntheticProvider
+from simulator import AccountSimulator
+from ledger import ALL
+
+
+# resting orders placed every tick close to the current price
+# orders are filled after algorithm, so the fills are seen at the next tick
+class OrderPlacer(AccountSimulator):
+    def __init__(self, provider):
+        super().__init__(100000, 0.001, provider)
+        self.submitted = {}   # order id -> submission date
+        self.filled = {}      # order id -> date of the tick it was filled at
+        self.previous_date = None
+
+    def collect_fills(self):
+        for order_id in self.submitted:
+            if not order_id in self.filled and self.get_order(order_id)["status"] == "filled":
+                self.filled[order_id] = self.previous_date
+
+    def algorithm(self):
+        self.collect_fills()
+        date = self.get_date()
+        self.previous_date = date
+        price = self.get_market().get_current_price("AAA")
+        order_id = self.submit_order("AAA", "buy", 1, "limit", limit_price=price * 0.999, expiry="day")
+        self.submitted[order_id] = date
+        if self.get_quantity("AAA") > 0:
+            order_id = self.submit_order("AAA", "sell", ALL, "trailing_stop", trail=price * 0.002, expiry="day")
+            self.submitted[order_id] = date
+            assert self.get_order_book().get_column('reference')[order_id] == price
+
+
+def test_orders_are_not_filled_at_or_before_the_submission_bar(offline):
+    provider = SyntheticProvider(seed=1, start=datetime(2020, 1, 1), end=datetime(2020, 7, 1))
+    simulator = OrderPlacer(provider)
+    simulator.run(datetime(2020, 3, 4), datetime(2020, 4, 4))
+    simulator.collect_fills()
+    assert len(simulator.filled) > 0
+
+    index = get_bar_index("AAA", "1h", provider)
+    for order_id, fill_date in simulator.filled.items():
+        submitted = simulator.submitted[order_id]
+        assert simulator.get_order(order_id)["submitted"] == submitted
+        assert fill_date > submitted
+        # the bar the order was filled by starts after the submission
+        assert index.get_dates()[index.asof(fill_date)] > to_timestamp(submitted)
@@ -0,0 +1,19 @@
+from datetime import datetime
+import pandas as pd
+import pytest
+import market
+from providers import SyntheticProvider, resample
+
+
+@pytest.mark.parametrize("interval", ["30m", "1h", "1d"])
+def test_resampled_bars_equal_generated_bars(interval):
+    provider = SyntheticProvider(seed=1, start=datetime(2020, 1, 1), end=datetime(2020, 7, 1), base_interval="5m")
+    pd.testing.assert_frame_equal(resample(provider.download("AAA", "5m"), interval), provider.download("AAA", interval))
+
+
+@pytest.mark.parametrize("interval", ["1h", "1d"])
+def test_pyramid_bars_of_the_market_equal_generated_bars(offline, interval):
+    direct = SyntheticProvider(seed=1, start=datetime(2020, 1, 1), end=datetime(2020, 7, 1))
+    pyramid = SyntheticProvider(seed=1, start=datetime(2020, 1, 1), end=datetime(2020, 7, 1), pyramid_interval="30m")
+    assert pyramid.get_base_interval(interval) is not None
+    pd.testing.assert_frame_equal(market.get_data("AAA", interval, pyramid), direct.download("AAA", interval))
@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+import numpy as np
+from providers import SyntheticProvider
+from journal import read_journal
+from simulator import AccountSimulator
+
+
+TICKERS = ["AAA", "BBB", "CCC", "DDD"]
+START = datetime(2020, 3, 4)
+MIDDLE = datetime(2020, 6, 12, 12)
+END = datetime(2020, 9, 5)
+
+
+def get_provider():
+    return SyntheticProvider(seed=1, start=datetime(2020, 1, 1), end=datetime(2021, 1, 1))
+
+def assert_same_run(simulator, reference):
+    assert len(reference.get_ledger()) > 0
+    assert simulator.get_date() == reference.get_date()
+    assert simulator.get_free_money() == reference.get_free_money()
+    assert simulator.get_portfolio_cost() == reference.get_portfolio_cost()
+    assert simulator.get_ledger().get_tickers() == reference.get_ledger().get_tickers()
+    for column in simulator.get_ledger().COLUMNS:
+        np.testing.assert_array_equal(simulator.get_ledger().get_column(column), reference.get_ledger().get_column(column))
+
+
+def test_resumed_checkpoint_reproduces_the_run_and_its_journal(offline, tmp_path, example_momentum_pinball):
+    strategy = example_momentum_pinball.AlgorithmMomentumPinball
+    provider = get_provider()
+    reference = strategy(3000, 0.00025, TICKERS, str(tmp_path / "reference.jsonl"), provider)
+    reference.run(START, END)
+
+    # the run stops after its last weekly checkpoint, the ticks after it are lost as in a crash
+    interrupted = strategy(3000, 0.00025, TICKERS, str(tmp_path / "run.jsonl"), provider)
+    interrupted.set_checkpoints(str(tmp_path / "run.ckpt"), timedelta(days=7))
+    interrupted.begin_run(START, END)
+    for date in interrupted.get_calendar().get_ticks(START, MIDDLE):
+        interrupted.step(date)
+    interrupted.end_run()
+
+    resumed = AccountSimulator.load_checkpoint(str(tmp_path / "run.ckpt"))
+    assert START < resumed.get_date() < interrupted.get_date()
+    resumed.resume()
+    assert_same_run(resumed, reference)
+    _, reference_days = read_journal(str(tmp_path / "reference.jsonl"))
+    _, resumed_days = read_journal(str(tmp_path / "run.jsonl"))
+    assert resumed_days == reference_days
+
+
+def test_fork_continues_as_the_run(offline, tmp_path, example_momentum_pinball):
+    strategy = example_momentum_pinball.AlgorithmMomentumPinball
+    provider = get_provider()
+    reference = strategy(3000, 0.00025, TICKERS, str(tmp_path / "reference.jsonl"), provider)
+    reference.run(START, END)
+
+    parent = strategy(3000, 0.00025, TICKERS, str(tmp_path / "parent.jsonl"), provider)
+    parent.run(START, MIDDLE)
+    child = parent.fork(str(tmp_path / "child.jsonl"))
+    child.resume(END)
+    parent.resume(END)
+    assert_same_run(child, reference)
+    assert_same_run(parent, reference)
@@ -0,0 +1,37 @@
+from datetime import datetime
+import pytest
+from providers import SyntheticProvider
+from vectorized import run_strategy, signals_80_20, signals_momentum_pinball
+
+
+TICKERS = ["AAA", "BBB", "CCC", "DDD"]
+START = datetime(2020, 3, 4)
+END = datetime(2020, 9, 5)
+
+
+# (date, ticker, side, quantity, price) of every operation of the event loop and of the vectorized fills
+def get_operations(simulator):
+    return sorted((str(date), ticker, side, quantity, price)
+                  for ticker, operations in simulator.get_operations_history().items()
+                  for date, side, quantity, price, _ in operations)
+
+def get_fills(result):
+    return sorted((str(result.get_ticks()[tick]), ticker, side, quantity, price)
+                  for tick, ticker, side, quantity, price, _ in result.get_fills())
+
+
+@pytest.mark.parametrize("example, strategy, signals, funds", [
+    ("example_80_20s", "Algorithm8020", signals_80_20, 300),
+    ("example_momentum_pinball", "AlgorithmMomentumPinball", signals_momentum_pinball, 3000),
+])
+def test_vectorized_port_matches_the_event_loop(offline, tmp_path, request, example, strategy, signals, funds):
+    provider = SyntheticProvider(seed=1, start=datetime(2020, 1, 1), end=datetime(2021, 1, 1))
+    simulator = getattr(request.getfixturevalue(example), strategy)(funds, 0.00025, TICKERS, str(tmp_path / "run.jsonl"), provider)
+    simulator.run(START, END)
+    result = run_strategy(signals, TICKERS, START, END, funds, 0.00025, provider)
+
+    operations = get_operations(simulator)
+    assert len(operations) > 0
+    assert get_fills(result) == operations
+    assert result.get_free_money() == pytest.approx(simulator.get_free_money(), rel=1e-12)
+    assert result.get_portfolio_cost() == pytest.approx(simulator.get_portfolio_cost(), rel=1e-12)
@@ -0,0 +1,129 @@
+from datetime import datetime, timedelta
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from pandas.tseries.holiday import (AbstractHolidayCalendar, Holiday, GoodFriday, USMartinLutherKingJr,
+                                    USPresidentsDay, USMemorialDay, USLaborDay, USThanksgivingDay,
+                                    nearest_workday, sunday_to_monday)
+
+
+class CalendarError(Exception):
+    pass
+
+
+# New York stock exchange holidays
+class NYSEHolidayCalendar(AbstractHolidayCalendar):
+    rules = [
+        Holiday("New Year's Day", month=1, day=1, observance=sunday_to_monday),
+        USMartinLutherKingJr,
+        USPresidentsDay,
+        GoodFriday,            # for example 02.04.21
+        USMemorialDay,
+        Holiday("Juneteenth", month=6, day=19, start_date=datetime(2022, 1, 1), observance=nearest_workday),
+        Holiday("Independence Day", month=7, day=4, observance=nearest_workday),
+        USLaborDay,
+        USThanksgivingDay,
+        Holiday("Christmas", month=12, day=25, observance=nearest_workday),
+    ]
+
+# days the exchange was closed for other reasons
+SPECIAL_CLOSURES = ["2001-09-11", "2001-09-12", "2001-09-13", "2001-09-14", "2004-06-11", "2007-01-02",
+                    "2012-10-29", "2012-10-30", "2018-12-05", "2025-01-09"]
+
+OPEN_TIME = timedelta(hours=9, minutes=30)
+CLOSE_TIME = timedelta(hours=16)
+EARLY_CLOSE_TIME = timedelta(hours=13)
+SESSION_OPEN_MINUTES = OPEN_TIME // timedelta(minutes=1)
+SESSION_MINUTES = (CLOSE_TIME - OPEN_TIME) // timedelta(minutes=1)   # of a full session
+
+
+# precomputed trading sessions: open and close time of every trading day
+# working hours are 9:30 - 16:00, the exchange closes at 13:00 on the day before Independence Day,
+# the day after Thanksgiving and Christmas Eve
+class TradingCalendar:
+    def __init__(self, start_year=1990, end_year=2040):
+        self.__start = datetime(start_year, 1, 1)
+        self.__end = datetime(end_year, 12, 31)
+
+        holidays = NYSEHolidayCalendar().holidays(self.__start, self.__end)
+        holidays = holidays.union(pd.DatetimeIndex(SPECIAL_CLOSURES))
+        days = pd.bdate_range(self.__start, self.__end)
+        days = days[~days.isin(holidays)]
+
+        thanksgivings = USThanksgivingDay.dates(self.__start, self.__end)
+        early = pd.DatetimeIndex(list(thanksgivings + timedelta(days=1)))
+        for year in range(start_year, end_year + 1):
+            for month, day in [(7, 3), (12, 24)]:
+                date = datetime(year, month, day)
+                if date.weekday() < 4:   # the holiday itself is on a working day
+                    early = early.append(pd.DatetimeIndex([date]))
+        is_early = days.isin(early)
+
+        self.__days = days.values.astype("datetime64[ns]")
+        self.__opens = self.__days + np.timedelta64(OPEN_TIME)
+        closes = np.where(is_early, np.timedelta64(EARLY_CLOSE_TIME), np.timedelta64(CLOSE_TIME))
+        self.__closes = self.__days + closes.astype("timedelta64[ns]")
+
+    def get_opens(self):
+        return self.__opens
+
+    def get_closes(self):
+        return self.__closes
+
+    def __check_range(self, date):
+        if date < self.__start or date > self.__end + timedelta(days=1):
+            raise CalendarError(f"{date} is out of the calendar range {self.__start} - {self.__end}")
+
+    def is_session(self, date):
+        self.__check_range(date)
+        day = np.datetime64(pd.Timestamp(date).normalize(), "ns")
+        position = np.searchsorted(self.__days, day)
+        return position < len(self.__days) and self.__days[position] == day
+
+    # close of the session of the date's day
+    def get_session_close(self, date):
+        self.__check_range(date)
+        day = np.datetime64(pd.Timestamp(date).normalize(), "ns")
+        position = np.searchsorted(self.__days, day)
+        if position == len(self.__days) or self.__days[position] != day:
+            raise CalendarError(f"{date.date()} is not a trading day")
+        return pd.Timestamp(self.__closes[position]).to_pydatetime()
+
+    # True if date is the last tick of its session: the next tick of the step would be at or after the close,
+    # it is 15:30 of regular sessions and 12:30 of early closes for hourly ticks
+    def is_session_end(self, date, step=timedelta(hours=1)):
+        return date + step >= self.get_session_close(date)
+
+    # (open, close) of sessions that start in [start_date, end_date]
+    def get_sessions(self, start_date, end_date):
+        self.__check_range(start_date)
+        self.__check_range(end_date)
+        first = np.searchsorted(self.__opens, np.datetime64(start_date, "ns"), side="left")
+        last = np.searchsorted(self.__opens, np.datetime64(end_date, "ns"), side="right")
+        return self.__opens[first:last], self.__closes[first:last]
+
+    # session ticks after start_date: open, open + step, ... while the session is open
+    # the ticks go up to end_date and include the first tick after it, as run always did
+    def get_ticks(self, start_date, end_date, step=timedelta(hours=1)):
+        self.__check_range(start_date)
+        step = np.timedelta64(step).astype("timedelta64[ns]")
+        first = np.searchsorted(self.__closes, np.datetime64(start_date, "ns"), side="right")
+        # a week more is enough to find the first tick after end_date
+        last = np.searchsorted(self.__opens, np.datetime64(end_date + timedelta(days=7), "ns"), side="right")
+        opens = self.__opens[first:last]
+        closes = self.__closes[first:last]
+        if len(opens) == 0:
+            raise CalendarError(f"no sessions after {start_date} in the calendar")
+
+        per_session = int(np.max((closes - opens + step - 1) // step))
+        ticks = opens[:, None] + np.arange(per_session)[None, :] * step
+        ticks = ticks[ticks < closes[:, None]]
+        ticks = ticks[ticks > np.datetime64(start_date, "ns")]
+
+        after_end = np.searchsorted(ticks, np.datetime64(end_date, "ns"), side="right")
+        return list(pd.DatetimeIndex(ticks[:after_end + 1]).to_pydatetime())
+
+
+@lru_cache(maxsize=1)
+def get_default_calendar():
+    return TradingCalendar()
@@ -0,0 +1,68 @@
+from metrics import EquityCurve
+
+
+# value of owned stocks marked to the market once per tick
+# only tickers with non-zero quantity are marked, fills change the value incrementally
+class Valuation:
+    def __init__(self, comission=0):
+        self.__comission = comission
+        self.__quantities = {}    # ticker -> owned quantity, flat positions are not kept
+        self.__marks = {}         # ticker -> price at the marks date
+        self.__marks_date = None
+        self.__value = 0          # sum of quantity * mark
+        self.__curve = EquityCurve()   # portfolio cost of every tick
+
+    def get_quantities(self):
+        return self.__quantities
+
+    def get_marks(self):
+        return self.__marks
+
+    # marks all owned tickers at the market date if they are not marked yet
+    def __mark(self, market):
+        date = market.get_date()
+        if date == self.__marks_date:
+            return
+        self.__marks = {ticker: market.get_current_price(ticker) for ticker in self.__quantities}
+        self.__value = sum(n * self.__marks[ticker] for ticker, n in self.__quantities.items())
+        self.__marks_date = date
+
+    # a new price of a ticker at the current marks date
+    def update_price(self, ticker, price):
+        if ticker in self.__quantities:
+            self.__value += self.__quantities[ticker] * (price - self.__marks[ticker])
+            self.__marks[ticker] = price
+
+    # n > 0 for purchases, n < 0 for sales, price is the current price of the ticker
+    def on_fill(self, ticker, n, price, date):
+        quantity = self.__quantities.get(ticker, 0) + n
+        if date == self.__marks_date:
+            if ticker in self.__marks:
+                self.update_price(ticker, price)
+            else:
+                self.__marks[ticker] = price
+            self.__value += n * price
+        if quantity == 0:
+            del self.__quantities[ticker]
+            self.__marks.pop(ticker, None)
+        else:
+            self.__quantities[ticker] = quantity
+        if len(self.__quantities) == 0:
+            self.__value = 0   # no rounding errors left after all positions are closed
+
+    # how much all stocks cost now in total, comission of selling them is taken into account
+    def get_value(self, market):
+        if len(self.__quantities) == 0:
+            return 0
+        self.__mark(market)
+        return self.__value - self.__value * self.__comission
+
+    def record(self, market, free_money):
+        self.__curve.add(market.get_date(), free_money, self.get_value(market))
+
+    def get_curve(self):
+        return self.__curve
+
+    # (dates, portfolio costs) recorded at every tick
+    def get_equity_series(self):
+        return self.__curve.get_dates().to_pydatetime(), self.__curve.get_equity()
@@ -0,0 +1,224 @@
+import numpy as np
+from pandas.tseries.offsets import BDay
+from market import Market
+from simulator import get_ticks
+from trading_calendar import get_default_calendar
+from indicators import IndicatorSet, WindowedRocRSI, SessionHighLow
+from ledger import ALL
+
+
+class VectorizedError(Exception):
+    pass
+
+
+# result of a vectorized run
+# every array has a row per tick, matrices have a column per ticker
+class VectorizedResult:
+    def __init__(self, ticks, tickers, cash, positions, equity, fills, total_comission):
+        self.__ticks = ticks
+        self.__tickers = tickers
+        self.__cash = cash
+        self.__positions = positions
+        self.__equity = equity
+        self.__fills = fills
+        self.__total_comission = total_comission
+
+    def get_ticks(self):
+        return self.__ticks
+    def get_tickers(self):
+        return self.__tickers
+    def get_cash(self):
+        return self.__cash
+    def get_positions(self):
+        return self.__positions
+    def get_equity(self):
+        return self.__equity
+    def get_portfolio_cost(self):
+        return self.__equity[-1] if len(self.__equity) > 0 else np.nan
+    def get_free_money(self):
+        return self.__cash[-1] if len(self.__cash) > 0 else np.nan
+    # [(tick number, ticker, 'buy'/'sell', quantity, price, comission)]
+    def get_fills(self):
+        return self.__fills
+    def get_total_comission_loss(self):
+        return self.__total_comission
+
+
+# (ticks x tickers) matrix of prices the event loop sees at every tick, nan where there is no data
+def build_price_matrix(tickers, ticks, provider=None):
+    market = Market(ticks[-1], provider)
+    prices = np.full((len(ticks), len(tickers)), np.nan)
+    for i, ticker in enumerate(tickers):
+        prices[:, i] = market.get_price_history(ticker, ticks)
+    return prices
+
+
+# runs buy and sell signals over the price matrix
+# buy_sizes: (ticks x tickers) number of stocks to buy, 0 - nothing
+# sell_sizes: (ticks x tickers) number of stocks to sell, 0 - nothing, ALL - all owned stocks,
+#             or a list of such matrices that are applied one after another
+# at every tick buys go first in tickers order then sells, as AccountSimulator.buy and sell do
+def run_signals(prices, buy_sizes, sell_sizes, start_funds, comission=0, ticks=None, tickers=None):
+    if comission < 0 or comission > 1:
+        raise ValueError("comission must be in range [0.0, 1.0]")
+    prices = np.asarray(prices, dtype=np.float64)
+    buy_sizes = np.asarray(buy_sizes)
+    if not isinstance(sell_sizes, (list, tuple)):
+        sell_sizes = [sell_sizes]
+    sell_sizes = [np.asarray(sizes) for sizes in sell_sizes]
+    if buy_sizes.shape != prices.shape or any(sizes.shape != prices.shape for sizes in sell_sizes):
+        raise VectorizedError("signals must have the shape of the price matrix")
+
+    n_ticks, n_tickers = prices.shape
+    if tickers is None:
+        tickers = list(range(n_tickers))
+
+    # only ticks with signals are visited, cash and positions are constant between them
+    has_price = ~np.isnan(prices)
+    active = ((buy_sizes > 0) & has_price).any(axis=1)
+    for sizes in sell_sizes:
+        active |= ((sizes != 0) & has_price).any(axis=1)
+
+    cash_changes = np.zeros(n_ticks)
+    position_changes = np.zeros((n_ticks, n_tickers), dtype=np.int64)
+    owned = np.zeros(n_tickers, dtype=np.int64)
+    money = start_funds
+    total_comission = 0
+    fills = []
+    for t in np.flatnonzero(active):
+        money_before = money
+        for i in np.flatnonzero((buy_sizes[t] > 0) & has_price[t]):
+            n = int(buy_sizes[t, i])
+            price = prices[t, i]
+            total_price = price * n
+            fill_comission = total_price * comission
+            if money < total_price + fill_comission:
+                continue
+            money -= total_price
+            money -= fill_comission
+            owned[i] += n
+            position_changes[t, i] += n
+            total_comission += fill_comission
+            fills.append((t, tickers[i], 'buy', n, price, fill_comission))
+
+        for sizes in sell_sizes:
+            for i in np.flatnonzero((sizes[t] != 0) & has_price[t]):
+                n = int(owned[i]) if sizes[t, i] == ALL else int(sizes[t, i])
+                if n <= 0 or owned[i] < n:
+                    continue
+                price = prices[t, i]
+                total_price = price * n
+                fill_comission = total_price * comission
+                money += total_price
+                money -= fill_comission
+                owned[i] -= n
+                position_changes[t, i] -= n
+                total_comission += fill_comission
+                fills.append((t, tickers[i], 'sell', n, price, fill_comission))
+        cash_changes[t] = money - money_before
+
+    cash = start_funds + np.cumsum(cash_changes)
+    positions = np.cumsum(position_changes, axis=0)
+    # owned stocks are valued as if they were sold at the tick: without comission
+    stock_values = np.where(positions != 0, positions * np.nan_to_num(prices), 0)
+    equity = cash + (stock_values - stock_values * comission).sum(axis=1)
+    return VectorizedResult(ticks, tickers, cash, positions, equity, fills, total_comission)
+
+
+# signals of the 80-20's algorithm (example_80-20s.py):
+# at 9:30 tickers with yesterday's Open in the lowest low_band and Close in the highest high_band of the range
+# are sold as soon as the price reaches yesterday's Close, vice versa for purchases
+def signals_80_20(tickers, ticks, prices, provider=None, low_band=0.2, high_band=0.8):
+    market = Market(ticks[-1], provider)
+    n_ticks, n_tickers = prices.shape
+    buy_sizes = np.zeros((n_ticks, n_tickers), dtype=np.int64)
+    sell_sizes = np.zeros((n_ticks, n_tickers), dtype=np.int64)
+
+    buy_levels = np.full(n_tickers, np.nan)    # nan - nothing to buy
+    sell_levels = np.full(n_tickers, np.nan)   # nan - nothing to sell
+    for t, date in enumerate(ticks):
+        if date.hour == 9 and date.minute == 30:
+            bars = market.get_day_bars(tickers, date - BDay(1))
+            buy_levels[:] = np.nan
+            sell_levels[:] = np.nan
+            if np.isnan(bars[:, 3]).any():   # no data: the day is skipped
+                continue
+            opens, highs, lows, closes = bars[:, 0], bars[:, 1], bars[:, 2], bars[:, 3]
+            ranges = highs - lows
+            to_sell = (opens <= low_band * ranges + lows) & (closes >= high_band * ranges + lows)
+            to_buy = ~to_sell & (closes <= low_band * ranges + lows) & (opens >= high_band * ranges + lows)
+            sell_levels[to_sell] = closes[to_sell]
+            buy_levels[to_buy] = closes[to_buy]
+            continue
+
+        bought = prices[t] <= buy_levels
+        buy_sizes[t, bought] = 1
+        buy_levels[bought] = np.nan
+        sold = prices[t] >= sell_levels
+        sell_sizes[t, sold] = ALL
+        sell_levels[sold] = np.nan
+    return buy_sizes, sell_sizes
+
+
+# signals of the momentum pinball algorithm (example_momentum-pinball.py):
+# at 10:30 a buying stop is set above the first hour range if yesterday's ROC(1) -> RSI(3) was below rsi_low,
+# a selling stop is set below it if it was above rsi_high; a bought ticker gets a saving stop at the first hour minimum
+def signals_momentum_pinball(tickers, ticks, prices, provider=None, rsi_low=30, rsi_high=70, calendar=None):
+    if calendar is None:
+        calendar = get_default_calendar()
+    n_ticks, n_tickers = prices.shape
+    buy_sizes = np.zeros((n_ticks, n_tickers), dtype=np.int64)
+    stop_sell_sizes = np.zeros((n_ticks, n_tickers), dtype=np.int64)
+    saving_sell_sizes = np.zeros((n_ticks, n_tickers), dtype=np.int64)
+
+    indicators = IndicatorSet(provider)
+    for ticker in tickers:
+        indicators.add(ticker, "lbr_rsi", WindowedRocRSI(7, 1, 3), "1d")
+        indicators.add(ticker, "session", SessionHighLow("close"), "1h")
+
+    buying_stops = np.full(n_tickers, np.nan)
+    selling_stops = np.full(n_tickers, np.nan)
+    saving_stops = np.full(n_tickers, np.nan)
+    first_hour_min = np.full(n_tickers, np.nan)
+    for t, date in enumerate(ticks):
+        if date.hour < 10:
+            continue
+
+        if date.hour == 10 and date.minute == 30:
+            indicators.advance(date)
+            for i, ticker in enumerate(tickers):
+                lbr_rsi = indicators.get(ticker, "lbr_rsi").get_value(date)
+                first_hour = indicators.get(ticker, "session")
+                if lbr_rsi is None or first_hour.get_day() != date.date():
+                    continue
+                if lbr_rsi < rsi_low:
+                    first_hour_min[i] = first_hour.get_low()
+                    buying_stops[i] = first_hour.get_high()
+                elif lbr_rsi > rsi_high:
+                    selling_stops[i] = first_hour.get_low()
+            continue
+
+        bought = prices[t] > buying_stops
+        buy_sizes[t, bought] = 1
+        buying_stops[bought] = np.nan
+        saving_stops[bought] = first_hour_min[bought]
+
+        sold = prices[t] < selling_stops
+        stop_sell_sizes[t, sold] = 1
+        selling_stops[sold] = np.nan
+
+        saved = prices[t] == saving_stops
+        saving_sell_sizes[t, saved] = 1
+        saving_stops[saved] = np.nan
+
+        if calendar.is_session_end(date):
+            buying_stops[:] = np.nan
+    return buy_sizes, [stop_sell_sizes, saving_sell_sizes]
+
+
+# runs a signal function over the ticks of AccountSimulator.run(start_date, end_date)
+def run_strategy(signals, tickers, start_date, end_date, start_funds, comission=0, provider=None, **parameters):
+    ticks = get_ticks(start_date, end_date)
+    prices = build_price_matrix(tickers, ticks, provider)
+    buy_sizes, sell_sizes = signals(tickers, ticks, prices, provider, **parameters)
+    return run_signals(prices, buy_sizes, sell_sizes, start_funds, comission, ticks, tickers)